@@ -0,0 +1,304 @@
+"""Preload, bake and resolve assets.
+
+Models are baked into bam files, and textures into txo files with compressed mipmaps,
+next to the sources. The baked files are used instead of the sources if they are newer.
+
+    >>>python assets.py
+"""
+import argparse
+import glob
+import os
+from collections import deque, OrderedDict
+from enum import Enum, auto
+
+from panda3d.core import Shader, TexturePool, Texture, SamplerState
+from panda3d.core import Loader, NodePath, Filename
+
+from utils import singleton
+
+
+MODEL_DIR = 'models'
+TEXTURE_DIR = 'textures'
+MODEL_EXTENSIONS = ('.egg.pz', '.egg')
+TEXTURE_EXTENSIONS = ('.jpg', '.png')
+
+
+def find_source(path):
+    """Return the file of path, which can be written without the extension like Loader.load_model.
+    """
+    for candidate in (path, f'{path}.egg', f'{path}.egg.pz', f'{path}.pz'):
+        if os.path.isfile(candidate):
+            return candidate
+
+    return path
+
+
+def get_baked_path(path):
+    for ext in MODEL_EXTENSIONS:
+        if path.endswith(ext):
+            return path[:-len(ext)] + '.bam'
+
+    root, ext = os.path.splitext(path)
+    if ext in TEXTURE_EXTENSIONS:
+        return f'{root}.txo'
+
+    return f'{path}.bam'
+
+
+def resolve(path):
+    """Return the path of the baked file if it is newer than the source; otherwise path.
+    """
+    source = find_source(path)
+    baked = get_baked_path(source)
+
+    if os.path.isfile(baked) and (
+            not os.path.isfile(source) or os.path.getmtime(baked) >= os.path.getmtime(source)):
+        return baked
+
+    return path
+
+
+def bake_model(path):
+    node = Loader.get_global_ptr().load_sync(Filename(path))
+    dest = get_baked_path(path)
+    NodePath(node).write_bam_file(Filename(dest))
+    return dest
+
+
+def bake_texture(path):
+    """Write a txo file with mipmaps, compressed by DXT1, or DXT5 if the texture has alpha.
+    """
+    tex = TexturePool.load_texture(Filename(path))
+    tex.set_minfilter(SamplerState.FT_linear_mipmap_linear)
+    tex.generate_ram_mipmap_images()
+    tex.compress_ram_image(Texture.CM_dxt5 if tex.get_num_components() == 4 else Texture.CM_dxt1)
+
+    dest = get_baked_path(path)
+    tex.write(Filename(dest))
+    TexturePool.release_texture(tex)
+    return dest
+
+
+def bake(model_dir=MODEL_DIR, texture_dir=TEXTURE_DIR, force=False):
+    """Bake all of the models and textures, which are not baked yet or changed after baked.
+    """
+    bakers = [(model_dir, MODEL_EXTENSIONS, bake_model), (texture_dir, TEXTURE_EXTENSIONS, bake_texture)]
+
+    for dir_path, extensions, baker in bakers:
+        for ext in extensions:
+            for path in sorted(glob.glob(f'{dir_path}/**/*{ext}', recursive=True)):
+                if path.endswith('.egg') and os.path.isfile(f'{path}.pz'):
+                    continue
+                if force or resolve(path) == path:
+                    print(f'{path} -> {baker(path)}')
+
+
+class AssetKinds(Enum):
+
+    TEXTURE = auto()
+    MODEL = auto()
+    SOUND = auto()
+
+
+class AssetEntry:
+
+    __slots__ = ('asset', 'kind', 'refs', 'size')
+
+    def __init__(self, asset, kind, size):
+        self.asset = asset
+        self.kind = kind
+        self.refs = 0
+        self.size = size
+
+
+@singleton
+class AssetRegistry:
+    """Keep the textures, models and sounds in use with their reference counts and memory sizes.
+       The assets no longer referenced are kept until the total size exceeds the budget,
+       and then unloaded from the least recently used.
+       Args:
+            budget (int): the memory size in bytes kept for the assets;
+    """
+
+    def __init__(self, budget=256 * 1024 ** 2):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.used = 0
+
+    def acquire(self, kind, path):
+        """Return the asset of path, loading it if it is not loaded, and add a reference to it.
+           Args:
+                kind (AssetKinds): the kind of the asset;
+                path (str): the path of the asset; the baked file is loaded if it is newer;
+        """
+        key = (kind, path)
+
+        if (entry := self.entries.get(key)) is None:
+            asset = self.load(kind, path)
+            entry = AssetEntry(asset, kind, self.estimate_size(kind, asset))
+            self.entries[key] = entry
+            self.used += entry.size
+
+        entry.refs += 1
+        self.entries.move_to_end(key)
+        self.evict()
+        return entry.asset
+
+    def release(self, kind, path):
+        """Remove a reference to the asset of path; the asset can be unloaded if it is not referenced.
+           The GPU memory of a texture is freed when its last reference is removed, and the texture
+           is uploaded again if it is acquired before unloaded.
+        """
+        if (entry := self.entries.get((kind, path))) is not None and entry.refs > 0:
+            entry.refs -= 1
+
+            if entry.refs == 0 and kind == AssetKinds.TEXTURE:
+                entry.asset.release_all()
+
+            self.evict()
+
+    def load(self, kind, path):
+        match kind:
+            case AssetKinds.TEXTURE:
+                return base.loader.load_texture(resolve(path))
+            case AssetKinds.MODEL:
+                return base.loader.load_model(resolve(path))
+            case AssetKinds.SOUND:
+                return base.loader.load_sfx(path)
+
+    def unload(self, entry):
+        match entry.kind:
+            case AssetKinds.TEXTURE:
+                TexturePool.release_texture(entry.asset)
+            case AssetKinds.MODEL:
+                base.loader.unload_model(entry.asset)
+            # sounds are freed when they are no longer referenced; they may be still fading out.
+
+    def estimate_size(self, kind, asset):
+        """Return the approximate memory size of the asset in bytes.
+        """
+        match kind:
+            case AssetKinds.TEXTURE:
+                return asset.estimate_texture_memory()
+
+            case AssetKinds.MODEL:
+                size = 0
+                for geom_np in asset.find_all_matches('**/+GeomNode'):
+                    for geom in geom_np.node().get_geoms():
+                        vdata = geom.get_vertex_data()
+                        size += sum(vdata.get_array(i).get_data_size_bytes() for i in range(vdata.get_num_arrays()))
+                        size += sum(prim.get_data_size_bytes() for prim in geom.get_primitives())
+                return size
+
+            case AssetKinds.SOUND:
+                # regarded as decoded into 16 bit stereo PCM of 44100 Hz.
+                return int(asset.length() * 44100 * 2 * 2)
+
+    def evict(self):
+        if self.used <= self.budget:
+            return
+
+        for key in [key for key, entry in self.entries.items() if entry.refs == 0]:
+            entry = self.entries.pop(key)
+            self.used -= entry.size
+            self.unload(entry)
+
+            if self.used <= self.budget:
+                break
+
+    def get_memory_usage(self):
+        """Return the memory sizes of the assets by kinds.
+        """
+        usage = {kind: 0 for kind in AssetKinds}
+        for entry in self.entries.values():
+            usage[entry.kind] += entry.size
+        return usage
+
+
+class AssetPreloader:
+    """Load models, textures, sounds and shaders in parallel before the scene is made.
+       Models and sounds are loaded by the threaded loader with callbacks, and textures and
+       shaders in the threads of a task chain. The loaded models, textures and shaders are
+       kept in the pools of Panda3D, so the later synchronous loads of them return at once.
+       'asset_progress' is sent with the numbers of the loaded and all assets every time
+       assets are loaded, and 'assets_loaded' when all of them are loaded.
+       Args:
+            num_threads (int): the number of threads loading textures and shaders;
+    """
+
+    def __init__(self, num_threads=2):
+        self.num_threads = num_threads
+        self.models = []
+        self.textures = []
+        self.sounds = []
+        self.shaders = []
+
+        self.assets = dict()
+        self.loaded = deque()
+        self.total = 0
+
+    def add_models(self, *paths):
+        self.models.extend(paths)
+
+    def add_textures(self, *paths):
+        self.textures.extend(paths)
+
+    def add_sounds(self, *paths):
+        self.sounds.extend(paths)
+
+    def add_shaders(self, *paths):
+        """Args:
+                paths (tuple): pairs of the vertex and fragment shader paths;
+        """
+        self.shaders.extend(paths)
+
+    def start(self):
+        self.total = len(self.models) + len(self.textures) + len(self.sounds) + len(self.shaders)
+
+        for path in self.models:
+            base.loader.load_model(resolve(path), callback=self.on_loaded, extraArgs=[path])
+
+        for path in self.sounds:
+            base.loader.load_sfx(path, callback=self.on_loaded, extraArgs=[path])
+
+        base.taskMgr.setupTaskChain('asset_loading', numThreads=self.num_threads)
+
+        for path in self.textures:
+            base.taskMgr.add(self.load_texture, f'load_{path}', extraArgs=[path], taskChain='asset_loading')
+
+        for paths in self.shaders:
+            base.taskMgr.add(self.load_shader, f'load_{paths[0]}', extraArgs=[paths], taskChain='asset_loading')
+
+        base.taskMgr.add(self.update, 'asset_preloader')
+
+    def load_texture(self, path):
+        self.loaded.append((path, TexturePool.load_texture(resolve(path))))
+
+    def load_shader(self, paths):
+        self.loaded.append((paths, Shader.load(Shader.SL_GLSL, *paths)))
+
+    def on_loaded(self, asset, path):
+        self.loaded.append((path, asset))
+
+    def update(self, task):
+        if self.loaded:
+            while self.loaded:
+                key, asset = self.loaded.popleft()
+                self.assets[key] = asset
+
+            base.messenger.send('asset_progress', [len(self.assets), self.total])
+
+        if len(self.assets) < self.total:
+            return task.cont
+
+        base.messenger.send('assets_loaded')
+        return task.done
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bake models into bam and textures into txo.')
+    parser.add_argument('--models', default=MODEL_DIR, help='the directory of egg models')
+    parser.add_argument('--textures', default=TEXTURE_DIR, help='the directory of textures')
+    parser.add_argument('--force', action='store_true', help='bake even if the baked files are newer')
+    args = parser.parse_args()
+    bake(args.models, args.textures, args.force)
@@ -0,0 +1,283 @@
+"""Declarative building definitions.
+
+A blueprint is a json file listing the static parts of a building, which are read into numpy arrays
+of kind, position, scale, hpr, collide mask and texture group. The parts are made in bulk
+from the arrays: the parts of each group and mask, except the ones with "own_body", are merged
+into one rigid body with a compound shape by Buildings.make_bodies, and the visible parts of
+each group into one geom by Buildings.instantiate.
+The meshes and shapes are computed by plan_blueprint with numpy, and only attached to the scene
+and the BulletWorld by the methods of Buildings. The bodies need no textures, so they are made
+before the assets are loaded.
+
+    {
+        "name": "mazeHouse",
+        "groups": {"walls": "BRICK2", "room_camera": null, ...},
+        "parts": [
+            {"name": "outer_walls_0", "group": "walls", "pos": [-7, 0, 3.5], "scale": [14.5, 0.5, 4], "hpr": [90, 0, 0]},
+            ...
+        ]
+    }
+
+Every part has a unique "name". A part can also have "kind" ("block", "pole" or "prism"; default "block"),
+"mask" (the name of a member of MultiMask or Mask; default "building"), "tex_scale", "hide", "lift"
+and "own_body". A part with "own_body" is made a rigid body of its own named by the name, so that
+it can be found after make_bodies. The floors, steps, landings and roofs the walker stands on must be
+bodies of their own, because the Lift of walker.py takes the height to raise to from the node of a step
+and walking.py finds the rooms by the names; so must the walls the doors are hinged on.
+A part with "lift" has an InvisibleLift named "<name>_lift" embedded in it.
+A group without a texture, like "room_camera", is made to be the parent of the parts made by code.
+
+A part with "room" is in the interior of the room named by it, which can be seen only from inside
+the room or through its portals; the interior parts are merged into geoms of their own, which
+RoomVisibility hides while the room cannot be seen. The rooms are listed with their portals,
+the openings like doors and open tops, which are boxes given by "pos", "scale" and "hpr" like parts.
+The local +y of a portal points into the room, and "to" is the room on the other side; outdoors if omitted.
+
+    "rooms": {
+        "room_jphouse": {"portals": [{"name": "entrance_0", "pos": [0, -7, 3.5], "scale": [1.5, 0.5, 4]}, ...]}
+    }
+
+The static parts of all the buildings are defined by blueprints. The doors, knobs, sensors,
+elevators, room cameras, rings, tubes, spheres, ropes, cloths and dynamic logs are still made
+by the methods of Buildings, which look up the parts they refer to by the names.
+"""
+import json
+from enum import Enum
+
+import numpy as np
+
+from panda3d.core import Geom, GeomNode, GeomTriangles, GeomVertexData
+
+from constants import Mask, MultiMask
+from create_geomnode import Cube, Cylinder, RightTriangularPrism
+
+
+class PartKinds(Enum):
+
+    BLOCK = 'block'
+    POLE = 'pole'
+    PRISM = 'prism'
+
+
+def get_mask(name):
+    if (mask := getattr(MultiMask, name, None)) is None:
+        mask = getattr(Mask, name)
+    return mask
+
+
+class Blueprint:
+    """The parts of a building as arrays; the i-th elements of the arrays are of the i-th part.
+       Args:
+            name (str): the name of the building;
+            groups (dict): the names of TextureImages members by the group names; None if no texture;
+            parts (list): the dicts of the parts;
+            rooms (dict): the dicts of the rooms by the room names;
+    """
+
+    def __init__(self, name, groups, parts, rooms=None):
+        self.name = name
+        self.groups = groups
+        self.rooms = rooms or dict()
+        group_ids = {group: i for i, group in enumerate(groups)}
+        room_ids = {room: i for i, room in enumerate(self.rooms)}
+        kinds = list(PartKinds)
+
+        self.kinds = np.array([kinds.index(PartKinds(p.get('kind', 'block'))) for p in parts], dtype=np.int8)
+        self.group_ids = np.array([group_ids[p['group']] for p in parts], dtype=np.int16)
+        self.pos = np.array([p['pos'] for p in parts], dtype=np.float32).reshape(-1, 3)
+        self.scale = np.array([p['scale'] for p in parts], dtype=np.float32).reshape(-1, 3)
+        self.hpr = np.array([p.get('hpr', (0, 0, 0)) for p in parts], dtype=np.float32).reshape(-1, 3)
+        self.masks = np.array([get_mask(p.get('mask', 'building')).get_word() for p in parts], dtype=np.uint32)
+        self.hide = np.array([p.get('hide', False) for p in parts], dtype=bool)
+        self.lift = np.array([p.get('lift', False) for p in parts], dtype=bool)
+        self.own_body = np.array([p.get('own_body', False) for p in parts], dtype=bool)
+        # -1 for the parts out of the rooms.
+        self.room_ids = np.array([room_ids[p['room']] if 'room' in p else -1 for p in parts], dtype=np.int16)
+        self.names = [p['name'] for p in parts]
+
+        # blocks are textured in proportion to their size like Buildings.block.
+        sx, sy, sz = self.scale.T
+        self.tex_scale = np.stack([(sx * 2 + sy * 2) / 4, sz / 4], axis=1)
+        for i, p in enumerate(parts):
+            if 'tex_scale' in p:
+                self.tex_scale[i] = p['tex_scale']
+            elif self.kinds[i] != kinds.index(PartKinds.BLOCK):
+                self.tex_scale[i] = 1
+
+    def __len__(self):
+        return len(self.kinds)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+
+        return cls(data['name'], data['groups'], data['parts'], data.get('rooms'))
+
+    def select(self, group=None, kind=None, visible=None, own_body=None, room_id=None):
+        """Return the indices of the parts matching all of the given conditions.
+           room_id is the index of a room in rooms, or -1 for the parts out of the rooms.
+        """
+        selected = np.ones(len(self), dtype=bool)
+
+        if group is not None:
+            selected &= self.group_ids == list(self.groups).index(group)
+        if kind is not None:
+            selected &= self.kinds == list(PartKinds).index(kind)
+        if visible is not None:
+            selected &= self.hide != visible
+        if own_body is not None:
+            selected &= self.own_body == own_body
+        if room_id is not None:
+            selected &= self.room_ids == room_id
+
+        return np.flatnonzero(selected)
+
+
+def rotation_matrices(hpr):
+    """Return the rotation matrices of hpr in degrees, which are the same as Panda3D's
+       and are applied to row vectors.
+    """
+    h, p, r = np.radians(hpr, dtype=np.float64).T
+    zeros, ones = np.zeros_like(h), np.ones_like(h)
+
+    def stack(rows):
+        return np.moveaxis(np.array(rows), -1, 0)
+
+    roll = stack([[np.cos(r), zeros, -np.sin(r)], [zeros, ones, zeros], [np.sin(r), zeros, np.cos(r)]])
+    pitch = stack([[ones, zeros, zeros], [zeros, np.cos(p), np.sin(p)], [zeros, -np.sin(p), np.cos(p)]])
+    heading = stack([[np.cos(h), np.sin(h), zeros], [-np.sin(h), np.cos(h), zeros], [zeros, zeros, ones]])
+    return roll @ pitch @ heading
+
+
+def read_prototype(model):
+    """Return the vertices and triangle indices of the first geom of a model made by GeomRoot,
+       whose rows are vertex(3), color(4), normal(3) and texcoord(2).
+    """
+    geom = model.node().get_geom(0)
+    vertices = np.frombuffer(memoryview(geom.get_vertex_data().get_array(0)), dtype=np.float32)
+    prim = geom.get_primitive(0)
+    indices = np.frombuffer(memoryview(prim.get_vertices()), dtype=np.uint16 if prim.get_index_type() == Geom.NT_uint16 else np.uint32)
+    return vertices.reshape(-1, 12).copy(), indices.astype(np.uint32)
+
+
+def build_mesh(vertices, indices, pos, hpr, scale, tex_scale):
+    """Return the vertices and indices of the copies of a prototype, transformed by the arrays
+       of the parts. The normals are transformed by the inverse transpose, and the texcoords
+       are scaled like set_tex_scale.
+    """
+    n = len(pos)
+    rotations = rotation_matrices(hpr)
+    mats = scale[:, :, None] * rotations
+
+    out = np.tile(vertices, (n, 1, 1))
+    out[:, :, 0:3] = vertices[:, 0:3] @ mats + pos[:, None, :]
+
+    normals = vertices[:, 7:10] @ (rotations / scale[:, :, None])
+    normals /= np.linalg.norm(normals, axis=2, keepdims=True)
+    out[:, :, 7:10] = normals
+    out[:, :, 10:12] = vertices[:, 10:12] * tex_scale[:, None, :]
+
+    offsets = np.arange(n, dtype=np.uint32)[:, None] * len(vertices)
+    return out.reshape(-1, 12), (indices + offsets).reshape(-1)
+
+
+def read_prototypes():
+    """Return the vertices and indices of the models of the kinds, which are the same as
+       the models of Buildings.
+    """
+    return {
+        PartKinds.BLOCK: read_prototype(Cube()),
+        PartKinds.POLE: read_prototype(Cylinder()),
+        PartKinds.PRISM: read_prototype(RightTriangularPrism())
+    }
+
+
+def get_shape_extents(kind, vertices, scale):
+    """Return the half extents of the box shape of a block, or the points of the convex hull
+       shape of the other kinds, whose size is multiplied by scale.
+    """
+    points = vertices[:, :3] * scale
+
+    if kind == PartKinds.BLOCK:
+        return (points.max(axis=0) - points.min(axis=0)) / 2
+
+    return np.unique(points, axis=0)
+
+
+class BuildPlan:
+    """The merged meshes and collision shapes of a blueprint, which are plain arrays.
+       Args:
+            blueprint (Blueprint): the parts of the building;
+    """
+
+    def __init__(self, blueprint):
+        self.blueprint = blueprint
+        # (group, kind, room, vertices, indices); room is None for the parts out of the rooms.
+        self.meshes = []
+        # (group, mask, hidden, indices of the parts, extents of the parts)
+        self.compounds = []
+        # the extents of the unscaled shapes by kinds, for the parts made into bodies of their own.
+        self.unit_extents = dict()
+
+
+def plan_blueprint(path, prototypes=None):
+    """Return the BuildPlan of a blueprint file.
+       Args:
+            path (str): the json file of the blueprint;
+            prototypes (dict): the return value of read_prototypes; made if None;
+    """
+    blueprint = Blueprint.load(path)
+    plan = BuildPlan(blueprint)
+    kinds = list(PartKinds)
+
+    if prototypes is None:
+        prototypes = read_prototypes()
+
+    for kind, (vertices, _) in prototypes.items():
+        plan.unit_extents[kind] = get_shape_extents(kind, vertices, np.ones(3, dtype=np.float32))
+
+    rooms = [None, *blueprint.rooms]
+
+    for group in blueprint.groups:
+        # the interior of each room is merged apart, so that it can be hidden after flatten_strong.
+        for room_id, room in enumerate(rooms, start=-1):
+            for kind, (vertices, indices) in prototypes.items():
+                if len(selected := blueprint.select(group, kind, visible=True, room_id=room_id)):
+                    arrays = [arr[selected] for arr in (
+                        blueprint.pos, blueprint.hpr, blueprint.scale, blueprint.tex_scale)]
+                    plan.meshes.append((group, kind, room, *build_mesh(vertices, indices, *arrays)))
+
+        # the hidden parts are kept out of the compounds of the visible parts, so that the bodies
+        # can be hidden with them; RoomVisibility does not take hidden bodies as occluders.
+        for hidden in (False, True):
+            merged = blueprint.select(group, visible=not hidden, own_body=False)
+
+            for mask in np.unique(blueprint.masks[merged]):
+                selected = merged[blueprint.masks[merged] == mask]
+                extents = [get_shape_extents(kinds[blueprint.kinds[i]], prototypes[kinds[blueprint.kinds[i]]][0],
+                                             blueprint.scale[i]) for i in selected]
+                plan.compounds.append((group, int(mask), hidden, selected, extents))
+
+    return plan
+
+
+def make_geom_node(name, vertex_format, vertices, indices):
+    """Make a GeomNode from the arrays of build_mesh.
+    """
+    vdata = GeomVertexData(name, vertex_format, Geom.UH_static)
+    vdata.unclean_set_num_rows(len(vertices))
+    memoryview(vdata.modify_array(0)).cast('B')[:] = vertices.astype(np.float32).tobytes()
+
+    prim = GeomTriangles(Geom.UH_static)
+    prim.set_index_type(Geom.NT_uint32 if len(vertices) > 0xffff else Geom.NT_uint16)
+    prim_array = prim.modify_vertices()
+    prim_array.unclean_set_num_rows(len(indices))
+    dtype = np.uint32 if len(vertices) > 0xffff else np.uint16
+    memoryview(prim_array).cast('B')[:] = indices.astype(dtype).tobytes()
+
+    geom = Geom(vdata)
+    geom.add_primitive(prim)
+    node = GeomNode(name)
+    node.add_geom(geom)
+    return node
@@ -1,15 +1,160 @@
-from panda3d.bullet import BulletSoftBodyNode
+from enum import Enum, auto
+
+import numpy as np
+
+from direct.showbase.ShowBaseGlobal import globalClock
+from panda3d.bullet import BulletSoftBodyNode, BulletRigidBodyNode
+from panda3d.bullet import BulletGhostNode, BulletBoxShape
 from panda3d.bullet import BulletHelper
 from panda3d.core import NodePath
-from panda3d.core import GeomNode, RopeNode
-from panda3d.core import Vec3, BitMask32
-from panda3d.core import GeomVertexFormat
-from panda3d.core import NurbsCurveEvaluator
+from panda3d.core import Geom, GeomNode, GeomTriangles, RopeNode
+from panda3d.core import Vec3, Point3, BitMask32
+from panda3d.core import GeomVertexFormat, GeomVertexData
+from panda3d.core import NurbsCurveEvaluator, BoundingBox
+
+from assets import resolve
+from constants import Mask, Config
+from utils import singleton
+from verlet_rope import VerletRopes
+
+
+class RopeBackends(Enum):
+
+    SOFTBODY = auto()
+    VERLET = auto()
+
+
+class ClothModes(Enum):
+
+    SIMULATED = auto()
+    KINEMATIC = auto()
+
+
+class SoftBodyQuality(Enum):
+    """(rope resolution, cloth resolution x, cloth resolution y, positions solver iterations, bending constraints)
+    """
+
+    HIGH = (8, 8, 12, 1, True)
+    MEDIUM = (6, 6, 9, 1, True)
+    LOW = (4, 4, 6, 1, False)
+
+    @property
+    def rope_res(self):
+        return self.value[0]
+
+    @property
+    def cloth_res(self):
+        return self.value[1:3]
+
+    @property
+    def iterations(self):
+        return self.value[3]
+
+    @property
+    def bending(self):
+        return self.value[4]
+
+    def downgrade(self, steps=1):
+        tiers = list(SoftBodyQuality)
+        return tiers[min(tiers.index(self) + steps, len(tiers) - 1)]
+
+
+@singleton
+class SoftBodyScheduler:
+    """Choose the quality of the soft bodies from the distance to the camera, and downgrade
+       them all when BulletWorld.do_physics takes longer than the physics budget. Bullet does not
+       time the soft bodies apart, so the whole physics step is measured, and the soft bodies,
+       which are the part whose cost can be changed, are downgraded to keep it.
+       Args:
+            world (BulletWorld): bullet world
+            quality (SoftBodyQuality): the quality of soft bodies near the camera;
+            distances (tuple): the distances where soft bodies are downgraded by one tier;
+            physics_budget (float): the maximum seconds which the whole BulletWorld.do_physics,
+                                    rigid bodies included, may take per frame;
+            max_rebuilds (int): the maximum number of soft bodies rebuilt at one update;
+            interval (float): the seconds between updates;
+    """
+
+    def __init__(self, world, quality=SoftBodyQuality.HIGH, distances=(40, 80),
+                 physics_budget=0.008, max_rebuilds=4, interval=0.5):
+        self.world = world
+        self.quality = quality
+        self.distances = distances
+        self.physics_budget = physics_budget
+        self.max_rebuilds = max_rebuilds
+        self.hysteresis = 5
+
+        # [maker, soft body, distance steps]; the maker must have rebuild(softbody, quality).
+        self.entries = []
+        self.physics_time = 0
+        self.over_budget = 0
+        base.taskMgr.do_method_later(interval, self.update, 'soft_body_scheduler')
+
+    def register(self, maker, softbody):
+        softbody.set_quality(self.quality)
+        self.entries.append([maker, softbody, 0])
+
+    def unregister(self, softbody):
+        self.entries = [entry for entry in self.entries if entry[1] != softbody]
+
+    def report(self, elapsed):
+        """Receive the seconds which BulletWorld.do_physics took.
+        """
+        self.physics_time = self.physics_time * 0.9 + elapsed * 0.1
+
+    def adjust_budget(self):
+        if self.physics_time > self.physics_budget:
+            self.over_budget = min(self.over_budget + 1, len(SoftBodyQuality) - 1)
+        elif self.physics_time < self.physics_budget * 0.5:
+            self.over_budget = max(self.over_budget - 1, 0)
+
+    def count_distance_steps(self, distance, last_steps):
+        steps = 0
+
+        for i, tier_distance in enumerate(self.distances):
+            # do not switch back and forth around the border.
+            if last_steps > i:
+                tier_distance -= self.hysteresis
+            if distance > tier_distance:
+                steps += 1
+
+        return steps
+
+    def update(self, task):
+        self.adjust_budget()
+        camera_pos = base.camera.get_pos(base.render)
+        rebuilds = 0
+
+        for entry in sorted(self.entries, key=lambda e: (e[1].get_center() - camera_pos).length()):
+            maker, softbody, last_steps = entry
+            distance = (softbody.get_center() - camera_pos).length()
+            entry[2] = self.count_distance_steps(distance, last_steps)
+
+            if (quality := self.quality.downgrade(entry[2] + self.over_budget)) == softbody.quality:
+                continue
+
+            if softbody.needs_rebuild(quality):
+                if rebuilds >= self.max_rebuilds:
+                    continue
+                entry[1] = maker.rebuild(softbody, quality)
+                rebuilds += 1
+            else:
+                softbody.set_quality(quality)
+
+        return task.again
 
 
 class RopeMaker:
+    """Args:
+            world (BulletWorld): bullet world
+            batch (bool): True: ropes sharing a texture are drawn by one RopeRenderer;
+                          False: each rope is drawn by its own RopeNode.
+            backend (RopeBackends): SOFTBODY: each rope is a BulletSoftBodyNode;
+                                    VERLET: all ropes are simulated together by VerletRopes.
+                                    VERLET ropes are always batched.
+    """
 
-    def __init__(self, world):
+    def __init__(self, world, batch=True, backend=RopeBackends.SOFTBODY):
         self.world = world
         self.info = self.world.get_world_info()
         self.info.set_air_density(1.2)
@@ -19,24 +164,137 @@ class RopeMaker:
 
         self.ropes = NodePath('Ropes')
         self.ropes.reparent_to(base.render)
+        self.batch = batch
+        self.backend = backend
+        self.renderers = dict()
+        self.verlet_ropes = dict()
+        self.scheduler = SoftBodyScheduler(world)
+        # the ropes taken out of the world by suspend.
+        self.suspended = []
 
-    def attach_last(self, suffix, tex, from_pt, to_pt, body, res=8):
-        fixeds = 1
+    def get_renderer(self, tex):
+        if tex not in self.renderers:
+            renderer = RopeRenderer(f'batched_ropes_{len(self.renderers)}', tex)
+            renderer.reparent_to(self.ropes)
+            self.renderers[tex] = renderer
+
+        return self.renderers[tex]
+
+    def get_verlet_ropes(self, tex, res):
+        if (key := (tex, res)) not in self.verlet_ropes:
+            # the same number of nodes as BulletSoftBodyNode.make_rope creates.
+            ropes = VerletRopes(self.world, res + 2)
+            self.get_renderer(tex).add_system(ropes)
+            self.verlet_ropes[key] = ropes
+
+        return self.verlet_ropes[key]
+
+    def visualize(self, rope):
+        if not self.batch:
+            rope.visualize()
+            return
+
+        self.get_renderer(rope.tex).add_rope(rope)
+
+    def make_rope(self, suffix, tex, from_pt, to_pt, res, fixeds, anchors):
+        """Args:
+                anchors (list): [(node index, body), ...] or [(node index, body, pivot), ...];
+                                the node index is 0 or -1.
+        """
         rope = Rope(self.ropes, suffix, tex, self.info, from_pt, to_pt, res, fixeds)
+        self.visualize(rope)
         self.world.attach_soft_body(rope.node())
-        rope.node().append_anchor(rope.node().get_num_nodes() - 1, body.node())
 
-    def attach_both(self, suffix, tex, from_pt, to_pt, from_body, to_body, res=8):
+        for anchor in anchors:
+            rope.anchor(*anchor)
+
+        return rope
+
+    def attach_last(self, suffix, tex, from_pt, to_pt, body, res=None):
+        if res is None:
+            res = self.scheduler.quality.rope_res
+
+        if self.backend == RopeBackends.VERLET:
+            self.get_verlet_ropes(tex, res).add_rope(from_pt, to_pt, to_body=body)
+            return
+
+        fixeds = 1
+        rope = self.make_rope(suffix, tex, from_pt, to_pt, res, fixeds, [(-1, body)])
+        self.scheduler.register(self, rope)
+
+    def attach_both(self, suffix, tex, from_pt, to_pt, from_body, to_body, res=None):
+        if res is None:
+            res = self.scheduler.quality.rope_res
+
+        if self.backend == RopeBackends.VERLET:
+            self.get_verlet_ropes(tex, res).add_rope(from_pt, to_pt, from_body, to_body)
+            return
+
         fixeds = 0
-        rope = Rope(self.ropes, suffix, tex, self.info, from_pt, to_pt, res, fixeds)
-        self.world.attach_soft_body(rope.node())
-        rope.node().append_anchor(0, from_body.node())
-        rope.node().append_anchor(rope.node().get_num_nodes() - 1, to_body.node())
+        rope = self.make_rope(suffix, tex, from_pt, to_pt, res, fixeds, [(0, from_body), (-1, to_body)])
+        self.scheduler.register(self, rope)
+
+    def remove(self, rope):
+        if self.batch:
+            self.get_renderer(rope.tex).remove_rope(rope)
+        else:
+            rope.rope.remove_node()
+
+        self.world.remove_soft_body(rope.node())
+        rope.remove_node()
+
+    def suspend(self):
+        """Hide the ropes, and remove them from the world and the scheduler. The anchors are
+           kept in the soft bodies, so the ropes hang from the same bodies when resumed.
+        """
+        self.suspended = [softbody for maker, softbody, _ in self.scheduler.entries if maker is self]
+
+        for rope in self.suspended:
+            self.scheduler.unregister(rope)
+            self.world.remove_soft_body(rope.node())
+
+        for ropes in self.verlet_ropes.values():
+            ropes.stop()
+
+        self.ropes.stash()
+
+    def resume(self):
+        self.ropes.unstash()
+
+        for ropes in self.verlet_ropes.values():
+            ropes.start()
+
+        for rope in self.suspended:
+            self.world.attach_soft_body(rope.node())
+            self.scheduler.register(self, rope)
+
+        self.suspended = []
+
+    def rebuild(self, rope, quality):
+        """Replace the rope with one made at the resolution of the quality. The new rope is made
+           straight from its first node toward its last node with the length of the original rope,
+           and its ends are anchored to the same points of the bodies, so that it sags the same.
+        """
+        nodes = rope.node().get_nodes()
+        from_pt = nodes[0].get_pos()
+        to_pt = from_pt + (nodes[-1].get_pos() - from_pt).normalized() * rope.length
+        new_rope = self.make_rope(rope.suffix, rope.tex, from_pt, to_pt,
+                                  quality.rope_res, rope.fixeds, rope.anchors)
+        new_rope.set_quality(quality)
+        self.remove(rope)
+        return new_rope
 
 
 class ClothMaker:
+    """Args:
+            world (BulletWorld): bullet world
+            kinematic (bool): True: cloths are waved by a procedural wind instead of being
+                              simulated while no body or character is near them.
+            margin (float): how far from a cloth a body or character is regarded as near;
+            idle_time (float): the seconds a cloth keeps being simulated after nothing is near;
+    """
 
-    def __init__(self, world):
+    def __init__(self, world, kinematic=True, margin=2, idle_time=3):
         self.world = world
         self.info = self.world.get_world_info()
         self.info.set_air_density(1.2)
@@ -46,13 +304,131 @@ class ClothMaker:
 
         self.cloths = NodePath('Cloths')
         self.cloths.reparent_to(base.render)
+        self.scheduler = SoftBodyScheduler(world)
+
+        self.kinematic = kinematic
+        self.margin = margin
+        self.idle_time = idle_time
+        # {suffix: [cloth, sensor, seconds since something was near]}
+        self.entries = dict()
+        # the cloths taken out of the world by suspend.
+        self.suspended = []
+        self.task_name = f'update_{self.cloths.get_name()}_{id(self)}'
 
-    def create_cloth(self, suffix, tex_path, pt00, pt10, pt01, pt11, resx, resy, fixeds=15):
-        cloth = Cloth(self.cloths, suffix, tex_path, self.info, pt00, pt10, pt01, pt11, resx, resy, fixeds)
+        if self.kinematic:
+            base.taskMgr.add(self.update, self.task_name)
+
+    def create_cloth(self, suffix, tex_path, pt00, pt10, pt01, pt11, resx=None, resy=None, fixeds=15):
+        if resx is None or resy is None:
+            resx, resy = self.scheduler.quality.cloth_res
+
+        cloth = Cloth(self.cloths, suffix, tex_path, self.info, pt00, pt10, pt01, pt11, resx, resy, fixeds,
+                      self.scheduler.quality.bending)
         self.world.attach_soft_body(cloth.node())
+        self.scheduler.register(self, cloth)
+
+        if self.kinematic:
+            sensor = ClothSensor(f'cloth_sensor_{suffix}', cloth, self.margin)
+            sensor.reparent_to(self.cloths)
+            self.world.attach_ghost(sensor.node())
+            self.entries[suffix] = [cloth, sensor, 0]
+
+    def rebuild(self, cloth, quality):
+        """Replace the cloth with one made at the resolution of the quality.
+        """
+        resx, resy = quality.cloth_res
+        new_cloth = Cloth(self.cloths, cloth.suffix, cloth.tex_path, self.info, *cloth.corners,
+                          resx, resy, cloth.fixeds, quality.bending)
+        self.world.attach_soft_body(new_cloth.node())
+        new_cloth.set_quality(quality)
+
+        if cloth.mode == ClothModes.KINEMATIC:
+            new_cloth.to_kinematic(self.world)
+        else:
+            self.world.remove_soft_body(cloth.node())
+
+        if cloth.suffix in self.entries:
+            self.entries[cloth.suffix][0] = new_cloth
+
+        cloth.remove_node()
+        return new_cloth
+
+    def suspend(self):
+        """Hide the cloths, and remove them and their sensors from the world and the scheduler.
+           The kinematic cloths are already out of the world, and stay kinematic when resumed.
+        """
+        self.suspended = [softbody for maker, softbody, _ in self.scheduler.entries if maker is self]
+
+        for cloth in self.suspended:
+            self.scheduler.unregister(cloth)
+            if cloth.mode == ClothModes.SIMULATED:
+                self.world.remove_soft_body(cloth.node())
 
+        for _, sensor, _ in self.entries.values():
+            self.world.remove(sensor.node())
 
-class Rope(NodePath):
+        base.taskMgr.remove(self.task_name)
+        self.cloths.stash()
+
+    def resume(self):
+        self.cloths.unstash()
+
+        if self.kinematic:
+            base.taskMgr.add(self.update, self.task_name)
+
+        for _, sensor, _ in self.entries.values():
+            self.world.attach_ghost(sensor.node())
+
+        for cloth in self.suspended:
+            if cloth.mode == ClothModes.SIMULATED:
+                self.world.attach_soft_body(cloth.node())
+            self.scheduler.register(self, cloth)
+
+        self.suspended = []
+
+    def update(self, task):
+        dt = globalClock.get_dt()
+        frame_time = globalClock.get_frame_time()
+
+        for entry in self.entries.values():
+            cloth, sensor, idle = entry
+
+            if sensor.detect_approach():
+                entry[2] = 0
+                if cloth.mode == ClothModes.KINEMATIC:
+                    cloth.to_simulated(self.world)
+                continue
+
+            match cloth.mode:
+                case ClothModes.SIMULATED:
+                    # leave the cloth simulated for a while to let it settle down.
+                    if (idle := idle + dt) >= self.idle_time:
+                        cloth.to_kinematic(self.world)
+                    entry[2] = idle
+
+                case ClothModes.KINEMATIC:
+                    cloth.wave(frame_time)
+
+        return task.cont
+
+
+class SoftBody(NodePath):
+    """The base class of soft bodies, which can be scheduled by SoftBodyScheduler.
+    """
+
+    def set_quality(self, quality):
+        self.quality = quality
+        self.node().get_cfg().set_positions_solver_iterations(quality.iterations)
+
+    def get_center(self):
+        return self.node().get_aabb().get_approx_center()
+
+    def needs_rebuild(self, quality):
+        """Override in subclasses."""
+        raise NotImplementedError()
+
+
+class Rope(SoftBody):
 
     def __init__(self, parent, suffix, tex, info, from_pt, to_pt, res, fixeds):
         super().__init__(BulletSoftBodyNode.make_rope(info, from_pt, to_pt, res, fixeds))
@@ -60,12 +436,41 @@ class Rope(NodePath):
         self.node().get_shape(0).set_margin(0.1)
         self.set_name(f'rope_{suffix}')
         self.reparent_to(parent)
+        self.suffix = suffix
+        self.tex = tex
+        self.res = res
+        self.fixeds = fixeds
+        # the rest length, kept when the rope is rebuilt at another resolution.
+        self.length = (to_pt - from_pt).length()
+        self.anchors = []
 
+    def anchor(self, idx, body, pivot=None):
+        """Args:
+                idx (int): 0: the first node; -1: the last node;
+                body (NodePath): the rigid body attached to the node;
+                pivot (Vec3): the point of the body the node is attached to, in the body's coordinates;
+                              the current position of the node if None;
+        """
+        node_idx = 0 if idx == 0 else self.node().get_num_nodes() - 1
+
+        if pivot is None:
+            pivot = body.get_relative_point(base.render, self.node().get_node(node_idx).get_pos())
+
+        self.node().append_anchor(node_idx, body.node(), pivot, False)
+        self.anchors.append((idx, body, pivot))
+
+    def needs_rebuild(self, quality):
+        return quality.rope_res != self.res
+
+    def visualize(self):
+        """Draw this rope by its own RopeNode.
+        """
         curve = NurbsCurveEvaluator()
-        curve.reset(res + 2)
+        curve.reset(self.node().get_num_nodes())
         self.node().link_curve(curve)
 
-        self.rope = NodePath(RopeNode(f'visualized_rope_{suffix}'))
+        parent = self.get_parent()
+        self.rope = NodePath(RopeNode(f'visualized_rope_{self.suffix}'))
         self.rope.node().set_curve(curve)
         self.rope.node().set_render_mode(RopeNode.RMTube)
         self.rope.node().set_uv_mode(RopeNode.UVParametric)
@@ -73,28 +478,310 @@ class Rope(NodePath):
         self.rope.node().set_num_slices(8)
         self.rope.node().set_thickness(0.1)
         self.rope.reparent_to(parent)
-        self.rope.set_texture(base.loader.loadTexture(tex))
+        self.rope.set_texture(base.loader.load_texture(resolve(self.tex)))
+
+
+class RopeRenderer(NodePath):
+    """Draw many ropes as tubes in one geom. Every frame, the positions of the soft body nodes
+       of all the ropes are read in one pass, and the tube vertices are computed with numpy
+       and written into one shared dynamic GeomVertexData. Ropes simulated by VerletRopes
+       can be drawn together with them.
+       Args:
+            name (str): the name of the geom node;
+            tex (str): the path of the texture shared by the ropes;
+            num_subdiv (int): the number of curve points between two soft body nodes;
+            num_slices (int): the number of vertices around the cross-section of a tube;
+            thickness (float): the diameter of the tubes, as in RopeNode;
+    """
+
+    def __init__(self, name, tex, num_subdiv=4, num_slices=8, thickness=0.1):
+        super().__init__(GeomNode(name))
+        self.num_subdiv = num_subdiv
+        self.num_slices = num_slices
+        self.thickness = thickness
+        self.node().set_final(True)
+        self.set_two_sided(True)
+        self.set_texture(base.loader.load_texture(resolve(tex)))
+
+        # parameters of the curve points between two soft body nodes.
+        self.params = (np.arange(self.num_subdiv, dtype=np.float32) / self.num_subdiv)[:, np.newaxis]
+        angles = np.linspace(0, 2 * np.pi, self.num_slices + 1, dtype=np.float32)
+        self.cos = np.cos(angles)[:, np.newaxis]
+        self.sin = np.sin(angles)[:, np.newaxis]
+
+        # ropes grouped by the number of soft body nodes; {num_nodes: [rope, ...]}
+        self.groups = dict()
+        self.systems = []
+        self.system_sizes = []
+        self.dirty = False
+        self.vdata = None
+        base.taskMgr.add(self.update, f'update_{name}', sort=10)
+
+    def add_rope(self, rope):
+        self.groups.setdefault(rope.node().get_num_nodes(), []).append(rope)
+        self.dirty = True
+
+    def remove_rope(self, rope):
+        ropes = self.groups[rope.node().get_num_nodes()]
+        ropes.remove(rope)
+
+        if not ropes:
+            del self.groups[rope.node().get_num_nodes()]
+        self.dirty = True
+
+    def add_system(self, system):
+        """Args:
+                system (VerletRopes): must have get_positions(), which returns an array of shape (ropes, nodes, 3).
+        """
+        self.systems.append(system)
+        self.dirty = True
+
+    def count_curve_points(self, num_nodes):
+        return (num_nodes - 1) * self.num_subdiv + 1
+
+    def rebuild(self):
+        """Allocate the vertex data and create the triangles for all of the ropes.
+           Texcoords and indices do not change while the ropes are the same, so they are
+           computed only here.
+        """
+        rings = self.num_slices + 1
+        self.layout = []
+        uvs = []
+        indices = []
+        start = 0
+
+        sources = [
+            (lambda ropes=ropes, num_nodes=num_nodes: self.get_positions(ropes, num_nodes), len(ropes), num_nodes)
+            for num_nodes, ropes in self.groups.items()
+        ]
+        sources += [(system.get_positions, len(system), system.num_nodes) for system in self.systems]
+        self.system_sizes = [len(system) for system in self.systems]
+
+        for get_positions, num_ropes, num_nodes in sources:
+            if not num_ropes:
+                continue
+
+            num_pts = self.count_curve_points(num_nodes)
+            num_verts = num_pts * rings
 
+            u = np.repeat(np.arange(num_pts, dtype=np.float32) / self.num_subdiv, rings)
+            v = np.tile(np.arange(rings, dtype=np.float32) / self.num_slices, num_pts)
+            uv = np.stack([u, v], axis=1)
 
-class Cloth(NodePath):
+            i, j = np.meshgrid(np.arange(num_pts - 1), np.arange(self.num_slices), indexing='ij')
+            idx = (i * rings + j).ravel()
+            tris = np.stack([idx, idx + 1, idx + rings, idx + rings, idx + 1, idx + 1 + rings], axis=1)
 
-    def __init__(self, parent, suffix, tex_path, info, pt00, pt10, pt01, pt11, resx, resy, fixeds):
+            for k in range(num_ropes):
+                uvs.append(uv)
+                indices.append(tris.ravel() + start + k * num_verts)
+
+            self.layout.append((get_positions, num_ropes, start, start + num_ropes * num_verts))
+            start += num_ropes * num_verts
+
+        self.node().remove_all_geoms()
+        self.vdata = None
+        self.dirty = False
+
+        if not start:
+            return
+
+        self.uvs = np.concatenate(uvs)
+        self.vdata = GeomVertexData('ropes', GeomVertexFormat.get_v3n3t2(), Geom.UH_dynamic)
+        self.vdata.unclean_set_num_rows(start)
+
+        prim = GeomTriangles(Geom.UH_static)
+        prim.set_index_type(Geom.NT_uint32)
+        prim_array = prim.modify_vertices()
+        prim_indices = np.concatenate(indices).astype(np.uint32)
+        prim_array.unclean_set_num_rows(len(prim_indices))
+        prim_mem = memoryview(prim_array).cast('B').cast('I')
+        prim_mem[:] = prim_indices
+
+        geom = Geom(self.vdata)
+        geom.add_primitive(prim)
+        self.node().add_geom(geom)
+
+    def get_positions(self, ropes, num_nodes):
+        """Return the soft body node positions of the ropes as an array of shape (ropes, nodes, 3).
+        """
+        values = [v for rope in ropes for nd in rope.node().get_nodes() for v in nd.get_pos()]
+        return np.array(values, dtype=np.float32).reshape(len(ropes), num_nodes, 3)
+
+    def interpolate(self, pts):
+        """Return the points on the Catmull-Rom curves passing through the soft body nodes.
+           Args:
+                pts (numpy.ndarray): the soft body node positions; shape (ropes, nodes, 3)
+        """
+        ext = np.concatenate([2 * pts[:, :1] - pts[:, 1:2], pts, 2 * pts[:, -1:] - pts[:, -2:-1]], axis=1)
+        p0, p1, p2, p3 = [ext[:, i:i + pts.shape[1] - 1, np.newaxis] for i in range(4)]
+        t = self.params
+
+        curve = 0.5 * (2 * p1 + (p2 - p0) * t + (2 * p0 - 5 * p1 + 4 * p2 - p3) * t ** 2
+                       + (3 * p1 - p0 - 3 * p2 + p3) * t ** 3)
+        curve = curve.reshape(len(pts), -1, 3)
+        return np.concatenate([curve, pts[:, -1:]], axis=1)
+
+    def make_tubes(self, curve):
+        """Return the vertices and normals of the tubes along the curves.
+           Args:
+                curve (numpy.ndarray): the curve points; shape (ropes, points, 3)
+        """
+        tangent = np.gradient(curve, axis=1)
+        tangent /= np.maximum(np.linalg.norm(tangent, axis=-1, keepdims=True), 1e-6)
+
+        # use the x axis as the reference where the rope is nearly vertical.
+        ref = np.zeros_like(tangent)
+        vertical = np.abs(tangent[..., 2]) > 0.99
+        ref[..., 0] = vertical
+        ref[..., 2] = ~vertical
+
+        normal = np.cross(tangent, ref)
+        normal /= np.maximum(np.linalg.norm(normal, axis=-1, keepdims=True), 1e-6)
+        binormal = np.cross(tangent, normal)
+
+        # shape (ropes, points, slices + 1, 3)
+        dirs = normal[:, :, np.newaxis] * self.cos + binormal[:, :, np.newaxis] * self.sin
+        verts = curve[:, :, np.newaxis] + dirs * self.thickness / 2
+        return verts.reshape(-1, 3), dirs.reshape(-1, 3)
+
+    def update(self, task):
+        # ropes can be added to VerletRopes systems after they are added to this renderer.
+        if self.dirty or [len(system) for system in self.systems] != self.system_sizes:
+            self.rebuild()
+
+        if self.vdata is None:
+            return task.cont
+
+        rows = np.empty((self.vdata.get_num_rows(), 8), dtype=np.float32)
+        rows[:, 6:] = self.uvs
+
+        for get_positions, _, start, end in self.layout:
+            pts = get_positions()
+            rows[start:end, :3], rows[start:end, 3:6] = self.make_tubes(self.interpolate(pts))
+
+        vdata_mem = memoryview(self.vdata.modify_array(0)).cast('B').cast('f')
+        vdata_mem[:] = rows.ravel()
+
+        # the bounds are not recomputed automatically because this node is final.
+        end, tip = rows[:, :3].min(axis=0), rows[:, :3].max(axis=0)
+        self.node().set_bounds(BoundingBox(Point3(*end), Point3(*tip)))
+        return task.cont
+
+
+class ClothSensor(NodePath):
+    """Detect a character or moving rigid bodies coming close to a cloth. Resting bodies,
+       like the logs hung near a cloth, are ignored.
+       Args:
+            name (str): the name of the ghost node;
+            cloth (Cloth): the cloth, which must be flat when this sensor is made;
+            margin (float): how far from the cloth a body or character is regarded as near;
+            min_speed (float): rigid bodies slower than this are regarded as resting;
+    """
+
+    def __init__(self, name, cloth, margin, min_speed=0.5):
+        super().__init__(BulletGhostNode(name))
+        bounds = cloth.node().get_aabb()
+        half_size = (bounds.get_max() - bounds.get_min()) / 2 + Vec3(margin)
+        self.node().add_shape(BulletBoxShape(half_size))
+        self.set_pos(bounds.get_approx_center())
+        self.set_collide_mask(Mask.sensor | Mask.collision)
+        self.min_speed = min_speed
+
+    def detect_approach(self):
+        for node in self.node().get_overlapping_nodes():
+            if node.get_name() == Config.character:
+                return True
+
+            if node.is_of_type(BulletRigidBodyNode.get_class_type()) and node.get_mass() > 0 \
+                    and node.get_linear_velocity().length() > self.min_speed:
+                return True
+
+
+class Cloth(SoftBody):
+    """Args:
+            amplitude (float): the amplitude of the procedural wind in the kinematic mode;
+            frequency (float): the frequency of the procedural wind in the kinematic mode;
+    """
+
+    def __init__(self, parent, suffix, tex_path, info, pt00, pt10, pt01, pt11, resx, resy, fixeds, bending=True,
+                 amplitude=0.15, frequency=0.5):
         super().__init__(BulletSoftBodyNode.make_patch(info, pt00, pt10, pt01, pt11, resx, resy, fixeds, True))
         material = self.node().append_material()
         material.set_linear_stiffness(0.4)
-        self.node().generate_bending_constraints(2, material)
+        if bending:
+            self.node().generate_bending_constraints(2, material)
         self.node().set_total_mass(50.0)
         self.node().get_shape(0).set_margin(0.5)
         self.set_name(f'cloth_{suffix}')
         self.reparent_to(parent)
+        self.suffix = suffix
+        self.tex_path = tex_path
+        self.corners = (pt00, pt10, pt01, pt11)
+        self.res = (resx, resy)
+        self.fixeds = fixeds
+        self.bending = bending
+        self.amplitude = amplitude
+        self.frequency = frequency
+        self.mode = ClothModes.SIMULATED
         self.set_collide_mask(BitMask32.all_on())
 
         fmt = GeomVertexFormat.getV3n3t2()
-        geom = BulletHelper.make_geom_from_faces(self.node(), fmt, True)
-        self.node().link_geom(geom)
+        self.geom = BulletHelper.make_geom_from_faces(self.node(), fmt, True)
+        self.node().link_geom(self.geom)
 
         self.cloth = NodePath(GeomNode(f'visualized_cloth_{suffix}'))
-        self.cloth.node().add_geom(geom)
+        self.cloth.node().add_geom(self.geom)
         self.cloth.reparent_to(self)
-        self.cloth.set_texture(base.loader.load_texture(tex_path))
-        BulletHelper.make_texcoords_for_patch(geom, resx, resy)
\ No newline at end of file
+        self.cloth.set_texture(base.loader.load_texture(resolve(tex_path)))
+        BulletHelper.make_texcoords_for_patch(self.geom, resx, resy)
+
+    def needs_rebuild(self, quality):
+        return quality.cloth_res != self.res or quality.bending != self.bending
+
+    def get_vertex_rows(self):
+        """Return a writable view of the vertex data as an array of shape (rows, floats per row).
+        """
+        vdata = self.geom.modify_vertex_data()
+        stride = vdata.get_format().get_array(0).get_stride() // 4
+        vdata_mem = memoryview(vdata.modify_array(0)).cast('B').cast('f')
+        return np.asarray(vdata_mem).reshape(-1, stride)
+
+    def to_kinematic(self, world):
+        """Stop simulating the cloth, and keep its current shape to be waved by wind.
+        """
+        vdata = self.geom.get_vertex_data()
+        fmt = vdata.get_format()
+        array_idx = fmt.get_array_with('sb_index')
+        start = fmt.get_column('sb_index').get_start()
+        data = np.frombuffer(vdata.get_array(array_idx).get_handle().get_data(), dtype=np.uint8)
+        data = data.reshape(-1, fmt.get_array(array_idx).get_stride())
+        self.sb_index = data[:, start:start + 2].copy().view(np.uint16).ravel().astype(np.int32)
+        self.rest = self.get_vertex_rows()[:, :3].copy()
+
+        # wave the both sides of the cloth in the same direction, along the normal of the patch;
+        # the node normals are not computed until the cloth is simulated once.
+        pt00, pt10, pt01, _ = (np.array(tuple(pt), dtype=np.float32) for pt in self.corners)
+        normal = np.cross(pt10 - pt00, pt01 - pt00)
+        self.directions = normal / np.linalg.norm(normal)
+        nodes = self.node().get_nodes()
+
+        # the nodes of a patch are arranged in a grid of resx by resy.
+        resx, resy = self.res
+        u = (np.arange(len(nodes)) % resx) / (resx - 1)
+        v = (np.arange(len(nodes)) // resx) / (resy - 1)
+        self.weights = (np.sin(np.pi * u) * np.sin(np.pi * v))[self.sb_index, np.newaxis]
+        self.phases = (2 * np.pi * (u + 0.5 * v))[self.sb_index, np.newaxis]
+
+        world.remove_soft_body(self.node())
+        self.mode = ClothModes.KINEMATIC
+
+    def to_simulated(self, world):
+        world.attach_soft_body(self.node())
+        self.node().set_active(True)
+        self.mode = ClothModes.SIMULATED
+
+    def wave(self, time):
+        offsets = self.amplitude * self.weights * np.sin(2 * np.pi * self.frequency * time - self.phases)
+        rows = self.get_vertex_rows()
+        rows[:, :3] = self.rest + self.directions * offsets
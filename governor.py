@@ -0,0 +1,147 @@
+"""Hold a target frame rate by stepping the render and simulation quality up and down.
+
+The frame times of the last frames are kept, and their percentile is compared with the frame
+time of the target fps at every interval. The quality goes down one tier when the percentile
+is over the target, and up one tier when it is well under the target. Every change is logged
+with the frame time percentiles, so that the quality can be correlated with the load.
+"""
+import json
+import time
+from collections import deque
+from enum import Enum
+
+import numpy as np
+
+from direct.directnotify.DirectNotifyGlobal import directNotify
+from direct.showbase.ShowBaseGlobal import globalClock
+from panda3d.core import ConfigVariableBool, ConfigVariableDouble, ConfigVariableString
+
+from create_softbody import SoftBodyScheduler, SoftBodyQuality
+from lights import ShadowQuality
+from utils import singleton
+
+
+quality_governor = ConfigVariableBool('quality-governor', True)
+target_fps = ConfigVariableDouble('target-fps', 60)
+# the member name of QualityTiers to start with.
+quality_tier = ConfigVariableString('quality-tier', 'HIGH')
+# the file where the changes are appended as json lines; sent to the notify category
+# quality_governor at the info level if empty.
+quality_log = ConfigVariableString('quality-log', '')
+
+notify = directNotify.newCategory('quality_governor')
+
+
+class QualityTiers(Enum):
+    """(shadow quality, terrain target triangle width, anisotropic degree, soft body quality)
+    """
+
+    ULTRA = (ShadowQuality.HIGH, 6.0, 16, SoftBodyQuality.HIGH)
+    HIGH = (ShadowQuality.MEDIUM, 10.0, 16, SoftBodyQuality.HIGH)
+    MEDIUM = (ShadowQuality.LOW, 14.0, 8, SoftBodyQuality.MEDIUM)
+    LOW = (ShadowQuality.OFF, 20.0, 2, SoftBodyQuality.LOW)
+
+    @property
+    def shadow(self):
+        return self.value[0]
+
+    @property
+    def triangle_width(self):
+        return self.value[1]
+
+    @property
+    def anisotropic_degree(self):
+        return self.value[2]
+
+    @property
+    def softbody(self):
+        return self.value[3]
+
+    def step(self, steps):
+        """Return the tier steps lower; higher if steps is negative.
+        """
+        tiers = list(QualityTiers)
+        return tiers[min(max(tiers.index(self) + steps, 0), len(tiers) - 1)]
+
+
+@singleton
+class QualityGovernor:
+    """Args:
+            scene (Scene): the scene whose terrain is changed;
+            light (BasicDayLight): the light whose shadow is changed;
+            window (int): the number of the last frames whose times are kept;
+            percentile (float): the percentile of the frame times compared with the target;
+            interval (float): the seconds between the checks;
+            headroom (float): the quality goes up when the percentile is under this ratio of the target;
+    """
+
+    def __init__(self, scene, light, window=120, percentile=95, interval=2.0, headroom=0.7):
+        self.scene = scene
+        self.light = light
+        self.percentile = percentile
+        self.headroom = headroom
+        self.frame_times = deque(maxlen=window)
+        self.tier = None
+        self.started = time.perf_counter()
+
+        # without the governor, the qualities set by shadow-quality and the others are kept.
+        if quality_governor.get_value():
+            self.set_tier(QualityTiers[quality_tier.get_value()])
+            base.taskMgr.add(self.record, 'record_frame_time')
+            base.taskMgr.do_method_later(interval, self.update, 'quality_governor')
+
+    def set_tier(self, tier, stats=None):
+        if tier == self.tier:
+            return
+
+        self.log(self.tier, tier, stats)
+        self.tier = tier
+        self.light.set_shadow_quality(tier.shadow)
+        self.scene.set_terrain_quality(tier.triangle_width)
+        self.scene.set_anisotropic_degree(tier.anisotropic_degree)
+        SoftBodyScheduler().quality = tier.softbody
+
+    def log(self, old_tier, new_tier, stats):
+        record = {
+            'time': round(time.perf_counter() - self.started, 3),
+            'from': old_tier.name if old_tier else None,
+            'to': new_tier.name,
+            **(stats or {})
+        }
+
+        if path := quality_log.get_value():
+            with open(path, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+        else:
+            notify.info(json.dumps(record))
+
+    def record(self, task):
+        self.frame_times.append(globalClock.get_dt())
+        return task.cont
+
+    def update(self, task):
+        if len(self.frame_times) < self.frame_times.maxlen:
+            return task.again
+
+        frame_times = np.array(self.frame_times)
+        target = 1 / target_fps.get_value()
+        measured = np.percentile(frame_times, self.percentile)
+        stats = {
+            'p50_ms': round(float(np.percentile(frame_times, 50)) * 1000, 2),
+            f'p{self.percentile}_ms': round(float(measured) * 1000, 2),
+            'target_ms': round(target * 1000, 2)
+        }
+
+        if measured > target:
+            tier = self.tier.step(1)
+        elif measured < target * self.headroom:
+            tier = self.tier.step(-1)
+        else:
+            return task.again
+
+        if tier != self.tier:
+            self.set_tier(tier, stats)
+            # judge the new tier by the frames rendered with it.
+            self.frame_times.clear()
+
+        return task.again
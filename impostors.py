@@ -0,0 +1,195 @@
+"""Draw the buildings far from the camera as camera-facing cards.
+
+The building is rendered from several headings into the cells of an atlas texture once it is
+built, and again when the sky changes the lights; one shared buffer renders an atlas a frame.
+A LODNode is inserted between the building and its children; the children are drawn within
+impostor-distance of the camera, and the card beyond it. The card turns around the vertical
+axis to face the camera, and shows the cell rendered from the heading nearest to the camera,
+so a far building costs one card and one small texture whatever its geometry is.
+"""
+import math
+from collections import deque
+
+from panda3d.core import ConfigVariableDouble, ConfigVariableInt
+from panda3d.core import NodePath, LODNode, Camera, OrthographicLens
+from panda3d.core import CardMaker, Texture, TextureStage, TransparencyAttrib
+from panda3d.core import FrameBufferProperties, GraphicsOutput
+
+from utils import singleton
+
+
+# the buildings farther than impostor-distance from the camera are drawn as the cards.
+impostor_distance = ConfigVariableDouble('impostor-distance', 60)
+# the number of the headings from which a building is rendered, and the size of the cells.
+impostor_views = ConfigVariableInt('impostor-views', 8)
+impostor_size = ConfigVariableInt('impostor-size', 128)
+
+
+class Impostor(NodePath):
+    """Args:
+            building (Buildings): a built building;
+            distance (float): the distance from the camera to the center of the building
+                              where the card replaces the building;
+            views (int): the number of the headings from which the building is rendered;
+    """
+
+    def __init__(self, building, distance, views):
+        super().__init__(LODNode(f'{building.get_name()}_impostor'))
+        self.building = building
+        self.views = views
+        self.view = None
+
+        self.detail = self.attach_new_node('impostor_detail')
+        end, tip = building.get_tight_bounds(building)
+        self.center = (end + tip) / 2
+        self.radius = (tip - end).length() / 2
+        self.attach()
+
+        self.texture = Texture(f'{building.get_name()}_impostor')
+        self.card = self.make_card()
+        # the switch is measured to the center; the near side of the building is at the distance.
+        self.node().add_switch(distance + self.radius, 0)
+        self.node().add_switch(1e6, distance + self.radius)
+        self.node().set_center(self.center)
+
+    def make_card(self):
+        maker = CardMaker('impostor_card')
+        maker.set_frame(-self.radius, self.radius, -self.radius, self.radius)
+        card = self.attach_new_node(maker.generate())
+        card.set_pos(self.center)
+        card.set_billboard_axis()
+        card.set_texture(self.texture)
+        card.set_tex_scale(TextureStage.get_default(), 1 / self.views, 1)
+        card.set_transparency(TransparencyAttrib.M_binary)
+
+        # the lights and the building shader are baked into the atlas.
+        card.set_light_off()
+        card.set_shader_off()
+        return card
+
+    def aim(self, cameras):
+        """Point the cameras of the bake buffer at the building from the headings.
+           Args:
+                cameras (NodePath): the parent of the cameras, one for each heading;
+        """
+        cameras.set_transform(self.building.get_net_transform())
+
+        for i, camera in enumerate(cameras.get_children()):
+            lens = camera.node().get_lens()
+            lens.set_film_size(self.radius * 2, self.radius * 2)
+            lens.set_near_far(self.radius, self.radius * 3)
+
+            camera.node().set_scene(self.detail)
+            camera.node().set_initial_state(self.building.get_net_state())
+            camera.set_pos(self.center)
+            camera.set_h(i * 360 / self.views)
+            camera.set_pos(camera, 0, -self.radius * 2, 0)
+
+    def attach(self):
+        """Insert the impostor between the building and its children.
+        """
+        for child in self.building.get_children():
+            child.reparent_to(self.detail)
+        self.reparent_to(self.building)
+
+    def detach(self):
+        """Put the children back under the building, and take out the impostor.
+        """
+        self.detach_node()
+        for child in self.detail.get_children():
+            child.reparent_to(self.building)
+
+    def update(self, camera):
+        """Show the cell rendered from the heading nearest to the camera.
+        """
+        pos = camera.get_pos(self.building) - self.center
+        heading = math.degrees(math.atan2(pos.x, -pos.y))
+
+        if (view := round(heading * self.views / 360) % self.views) != self.view:
+            self.view = view
+            self.card.set_tex_offset(TextureStage.get_default(), view / self.views, 0)
+
+
+@singleton
+class ImpostorManager:
+    """Args:
+            distance (float): the distance where the cards replace the buildings; impostor-distance if None;
+            views (int): the number of the headings from which a building is rendered; impostor-views if None;
+            size (int): the width and height of a cell of an atlas; impostor-size if None;
+    """
+
+    def __init__(self, distance=None, views=None, size=None):
+        self.distance = impostor_distance.get_value() if distance is None else distance
+        self.views = impostor_views.get_value() if views is None else views
+        self.size = impostor_size.get_value() if size is None else size
+        self.impostors = []
+        self.baking = deque()
+        self.baked = None
+        self.buffer, self.cameras = self.make_buffer()
+        base.taskMgr.add(self.update, 'update_impostors')
+
+    def make_buffer(self):
+        """Make the buffer which renders the atlases of all of the impostors one by one. It is made
+           once, because opening a buffer while the buildings are built stalls the frame.
+        """
+        fb_props = FrameBufferProperties()
+        fb_props.set_rgba_bits(8, 8, 8, 8)
+        fb_props.set_depth_bits(16)
+
+        buffer = base.win.make_texture_buffer(
+            'impostor_bake', self.size * self.views, self.size, Texture('impostor_bake'), True, fb_props)
+        buffer.set_clear_color((0, 0, 0, 0))
+        buffer.set_active(False)
+        # the cameras are out of the buildings, so that they are not written into the snapshot.
+        cameras = base.render.attach_new_node('impostor_cameras')
+
+        for i in range(self.views):
+            camera = cameras.attach_new_node(Camera(f'impostor_camera_{i}', OrthographicLens()))
+            display_region = buffer.make_display_region(i / self.views, (i + 1) / self.views, 0, 1)
+            display_region.set_camera(camera)
+
+        return buffer, cameras
+
+    def register(self, building):
+        impostor = Impostor(building, self.distance, self.views)
+        self.impostors.append(impostor)
+        self.baking.append(impostor)
+        return impostor
+
+    def rebake(self):
+        """Render all of the atlases again, so that the cards are lit like the buildings after
+           the lights are changed.
+        """
+        self.baking = deque(self.impostors)
+
+    def bake(self, impostor):
+        """Render the building of the impostor into its atlas in this frame.
+        """
+        self.buffer.clear_render_textures()
+        self.buffer.add_render_texture(impostor.texture, GraphicsOutput.RTM_copy_ram)
+        impostor.aim(self.cameras)
+        # the buffer renders a frame and then deactivates itself.
+        self.buffer.set_active(True)
+        self.buffer.set_one_shot(True)
+        self.baked = impostor
+
+    def detach(self):
+        for impostor in self.impostors:
+            impostor.detach()
+
+    def attach(self):
+        for impostor in self.impostors:
+            impostor.attach()
+
+    def update(self, task):
+        # an atlas is rendered in a frame, so that the baking does not stall the frame.
+        if self.baked and not self.buffer.is_active():
+            self.baked = None
+
+        if self.baking and not self.baked:
+            self.bake(self.baking.popleft())
+
+        for impostor in self.impostors:
+            impostor.update(base.camera)
+
+        return task.cont
@@ -1,6 +1,31 @@
+from enum import Enum
+
 from panda3d.core import AmbientLight, DirectionalLight
 from panda3d.core import NodePath, PandaNode
 from panda3d.core import Vec3, Point3, LColor
+from panda3d.core import ConfigVariableString
+
+
+# the member name of ShadowQuality used by BasicDayLight.
+shadow_quality = ConfigVariableString('shadow-quality', 'MEDIUM')
+
+
+class ShadowQuality(Enum):
+    """(shadow map size, film size)
+    """
+
+    HIGH = (4096, 100)
+    MEDIUM = (2048, 80)
+    LOW = (1024, 60)
+    OFF = (0, 0)
+
+    @property
+    def map_size(self):
+        return self.value[0]
+
+    @property
+    def film_size(self):
+        return self.value[1]
 
 
 class BasicAmbientLight(NodePath):
@@ -19,13 +44,24 @@ class BasicAmbientLight(NodePath):
 
 
 class BasicDayLight(NodePath):
+    """A directional light casting shadows around the target. The light keeps its direction
+       and moves with the target every frame, and the shadow map only covers the film around
+       the target. The shadow pass is not rendered while the light is black.
+       Args:
+            target (NodePath): the shadows around this are rendered;
+            quality (ShadowQuality): shadow-quality if None;
+            distance (float): the distance from the target to the light;
+    """
 
-    def __init__(self, parent):
+    def __init__(self, target, quality=None, distance=100):
         super().__init__(DirectionalLight('directional_light'))
-        self.node().get_lens().set_film_size(200, 200)
-        self.node().get_lens().set_near_far(10, 200)
-        self.set_pos_hpr(Point3(0, 0, 50), Vec3(-30, -45, 0))
-        self.node().set_shadow_caster(True, 8192, 8192)
+        self.target = target
+        self.distance = distance
+        self.quality = ShadowQuality[shadow_quality.get_value()] if quality is None else quality
+        self.is_on = True
+
+        self.node().get_lens().set_near_far(10, distance * 2)
+        self.set_hpr(Vec3(-30, -45, 0))
 
         state = self.node().get_initial_state()
         temp = NodePath(PandaNode('temp_np'))
@@ -35,11 +71,51 @@ class BasicDayLight(NodePath):
 
         base.render.set_light(self)
         base.render.set_shader_auto()
+        self.set_shadow_quality(self.quality)
         self.set_brightness()
-        self.reparent_to(parent)
+        self.reparent_to(base.render)
+        self.follow()
+        base.taskMgr.add(self.update, 'update_day_light', sort=45)
+
+    def set_shadow_quality(self, quality):
+        self.quality = quality
+
+        if quality == ShadowQuality.OFF or not self.is_on:
+            self.node().set_shadow_caster(False)
+            return
+
+        self.node().get_lens().set_film_size(quality.film_size, quality.film_size)
+        self.node().set_shadow_caster(True, quality.map_size, quality.map_size)
 
     def set_brightness(self, color=None):
         if color is None:
             color = LColor(1, 1, 1, 1)
 
         self.node().set_color(color)
+
+        # the shadow pass of a black light is useless.
+        if (is_on := color.get_xyz() != Vec3(0)) != self.is_on:
+            self.is_on = is_on
+            self.set_shadow_quality(self.quality)
+
+    def follow(self):
+        """Move the light to look at the target. The target position is snapped to the texels
+           of the shadow map, so that the shadows do not shimmer while the target moves.
+        """
+        quat = self.get_quat()
+        right, up, forward = quat.get_right(), quat.get_up(), quat.get_forward()
+        pos = self.target.get_pos(base.render)
+
+        if self.quality != ShadowQuality.OFF:
+            texel = self.quality.film_size / self.quality.map_size
+            pos = right * round(pos.dot(right) / texel) * texel \
+                + up * round(pos.dot(up) / texel) * texel \
+                + forward * pos.dot(forward)
+
+        self.set_pos(Point3(pos - forward * self.distance))
+
+    def update(self, task):
+        if self.is_on and self.quality != ShadowQuality.OFF:
+            self.follow()
+
+        return task.cont
@@ -0,0 +1,207 @@
+"""Pack the textures of the buildings into the layers of a 2D texture array.
+
+The geoms of a packed building keep the layer of their texture in the vertex column 'layer', and
+their texture matrices are applied to the texture coordinates, which keep repeating beyond 0-1.
+So all of the geoms share one texture and no texture matrix, and the render states of a building
+differ only in the colors. The packed buildings are drawn by the building shader, which samples
+the texture array and lights it like the auto-shader.
+"""
+import numpy as np
+
+from panda3d.core import ConfigVariableBool, ConfigVariableInt
+from panda3d.core import Texture, SamplerState, PNMImage
+from panda3d.core import TextureAttrib, TexMatrixAttrib, ShaderAttrib, InternalName
+from panda3d.core import Geom, GeomVertexData, GeomVertexFormat, GeomVertexArrayFormat
+from panda3d.core import GeomVertexRewriter
+
+from assets import AssetRegistry, AssetKinds
+from buildings import TextureImages
+from shader_cache import ShaderCache
+from utils import singleton, supports_shaders
+
+
+material_packing = ConfigVariableBool('material-packing', True)
+# the width and height of the layers; the textures are scaled to this.
+material_layer_size = ConfigVariableInt('material-layer-size', 512)
+
+BUILDING_SHADER = ('shaders/building.vert.glsl', 'shaders/building.frag.glsl')
+
+
+def is_packing_enabled():
+    """Return True if the buildings are packed; the texture array is drawn only by the building
+       shader, so the buildings are not packed where the window cannot run it.
+    """
+    gsg = base.win.get_gsg() if base.win else None
+    return (material_packing.get_value() and supports_shaders()
+            and (gsg is None or gsg.get_supports_2d_texture_array()))
+
+
+@singleton
+class MaterialPacker:
+    """Args:
+            images (list): the members of TextureImages packed; all but the terrain and water if None;
+            size (int): the width and height of the layers; material-layer-size if None;
+    """
+
+    NAME = 'building_materials'
+
+    def __init__(self, images=None, size=None):
+        if images is None:
+            images = [image for image in TextureImages if image not in (TextureImages.WATER, TextureImages.GRASS)]
+
+        self.layers = {image: i for i, image in enumerate(images)}
+        # the last layer is white for the geoms without textures.
+        self.white_layer = len(images)
+        self.texture = self.make_texture_array(images, material_layer_size.get_value() if size is None else size)
+        self.formats = dict()
+
+        # written into the snapshots instead of the texture array.
+        self.placeholder = Texture(self.NAME)
+        self.placeholder.setup_2d_texture_array(1, 1, 1, Texture.T_unsigned_byte, Texture.F_rgb)
+        self.placeholder.make_ram_image()
+
+    def make_texture_array(self, images, size):
+        tex = Texture(self.NAME)
+        tex.setup_2d_texture_array(size, size, len(images) + 1, Texture.T_unsigned_byte, Texture.F_rgb)
+
+        # the textures are taken from the registry, which loads the baked files and shares
+        # the preloaded textures with the buildings.
+        for z, image in enumerate(images):
+            source = PNMImage()
+            AssetRegistry().acquire(AssetKinds.TEXTURE, image.path).store(source)
+            AssetRegistry().release(AssetKinds.TEXTURE, image.path)
+
+            layer = PNMImage(size, size, 3)
+            layer.gaussian_filter_from(1.0, source)
+            tex.load(layer, z, 0)
+
+        white = PNMImage(size, size, 3)
+        white.fill(1)
+        tex.load(white, self.white_layer, 0)
+
+        tex.set_wrap_u(Texture.WM_repeat)
+        tex.set_wrap_v(Texture.WM_repeat)
+        tex.set_minfilter(SamplerState.FT_linear_mipmap_linear)
+        # the same as the grass; changed by QualityGovernor with the quality tier.
+        tex.set_anisotropic_degree(16)
+        return tex
+
+    def get_format(self, vertex_format):
+        """Return the vertex format with the column 'layer' added.
+        """
+        key = vertex_format.this
+
+        if (packed_format := self.formats.get(key)) is None:
+            packed_format = GeomVertexFormat(vertex_format)
+            packed_format.add_array(GeomVertexArrayFormat('layer', 1, Geom.NT_float32, Geom.C_other))
+            packed_format = GeomVertexFormat.register_format(packed_format)
+            self.formats[key] = packed_format
+
+        return packed_format
+
+    def get_layers(self, building):
+        """Return the layers of the geoms under the building with their texture matrices,
+           or None if any geom has a texture which is not packed.
+        """
+        layers = {building.textures[image].get_name(): i for image, i in self.layers.items()
+                  if image in building.textures}
+        geoms = []
+
+        for geom_np in building.find_all_matches('**/+GeomNode'):
+            net_state = geom_np.get_net_state()
+
+            for i in range(geom_np.node().get_num_geoms()):
+                state = net_state.compose(geom_np.node().get_geom_state(i))
+
+                if (tex := state.get_attrib(TextureAttrib)) and tex.get_texture():
+                    if (layer := layers.get(tex.get_texture().get_name())) is None:
+                        return None
+                else:
+                    layer = self.white_layer
+
+                mat = attrib.get_mat() if (attrib := state.get_attrib(TexMatrixAttrib)) else None
+                geoms.append((geom_np, i, layer, mat))
+
+        return geoms
+
+    def get_rows(self, vdata, column_name):
+        """Return a writable view of the float32 column of the vertex data, or None if the column
+           is stored in another numeric type.
+        """
+        fmt = vdata.get_format()
+        idx = fmt.get_array_with(column_name)
+        column = fmt.get_column(column_name)
+
+        if column.get_numeric_type() != Geom.NT_float32:
+            return None
+
+        stride = fmt.get_array(idx).get_stride()
+        start = column.get_start()
+        rows = np.asarray(memoryview(vdata.modify_array(idx)).cast('B')).reshape(-1, stride)
+        return rows[:, start:start + column.get_num_components() * 4].view(np.float32)
+
+    def pack_geom(self, geom, layer, mat):
+        geom = geom.make_copy()
+        vdata = geom.get_vertex_data()
+        vdata = GeomVertexData(vdata.convert_to(self.get_format(vdata.get_format())))
+
+        # the columns are written as arrays; the rows one by one take most of the packing time.
+        self.get_rows(vdata, 'layer')[:] = layer
+
+        if mat is not None and vdata.has_column(InternalName.get_texcoord()):
+            if (uvs := self.get_rows(vdata, InternalName.get_texcoord())) is not None:
+                m = np.array([tuple(mat.get_row(i)) for i in range(4)], dtype=np.float32)
+                uvs[:, :2] = uvs[:, :2] @ m[:2, :2] + m[3, :2]
+            else:
+                rewriter = GeomVertexRewriter(vdata, InternalName.get_texcoord())
+                while not rewriter.is_at_end():
+                    uv = mat.xform_point(rewriter.get_data3())
+                    rewriter.set_data2(uv.x, uv.y)
+
+        geom.set_vertex_data(vdata)
+        return geom
+
+    def pack(self, building):
+        """Rewrite the geoms of the building to sample the texture array, and release the textures
+           of the building. Return False if the building has textures which are not packed.
+           Args:
+                building (Buildings): a built building;
+        """
+        if (geoms := self.get_layers(building)) is None:
+            return False
+
+        for geom_np, i, layer, mat in geoms:
+            node = geom_np.node()
+            node.set_geom(i, self.pack_geom(node.get_geom(i), layer, mat))
+            state = node.get_geom_state(i).remove_attrib(TexMatrixAttrib)
+            node.set_geom_state(i, state.set_attrib(TextureAttrib.make(self.texture)))
+
+        for part in [building, *building.find_all_matches('**')]:
+            part.clear_texture()
+            part.clear_tex_transform()
+
+        building.release_textures()
+        # the geoms differing only in the textures before are merged.
+        building.flatten_strong()
+        self.bind(building)
+        return True
+
+    def bind(self, building):
+        """Set the building shader on a packed building; the placeholders of the texture array
+           in a building loaded from a snapshot are replaced with the texture array.
+        """
+        textures = building.find_all_textures(self.NAME)
+
+        for i in range(textures.get_num_textures()):
+            if (tex := textures.get_texture(i)) != self.texture:
+                building.replace_texture(tex, self.texture)
+
+        if textures.get_num_textures():
+            building.set_shader(ShaderCache().load(BUILDING_SHADER))
+
+    def unbind(self, building):
+        """Remove the building shader and the texture array, which bam cannot keep.
+        """
+        # clear_shader would leave an empty ShaderAttrib, which cannot be read from a bam file.
+        building.node().clear_attrib(ShaderAttrib)
+        building.replace_texture(self.texture, self.placeholder)
@@ -0,0 +1,130 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from utils import singleton
+
+
+@singleton
+class StartupProfiler:
+    """Record the wall time, the memory allocated by Python, the numbers of Bullet bodies,
+       shapes and constraints, and the time spent in flatten_strong for each phase of startup,
+       and write them into a json report. Does nothing unless report_path is given.
+       Args:
+            report_path (str): the path of the json report;
+    """
+
+    def __init__(self, report_path=None):
+        self.report_path = report_path
+        self.world = None
+        self.started = None
+        self.stack = []
+        self.phases = []
+
+    @property
+    def enabled(self):
+        return self.report_path is not None and self.started is not None
+
+    def start(self, world):
+        if self.report_path is None:
+            return
+
+        self.world = world
+        self.started = time.perf_counter()
+        tracemalloc.start()
+
+    def count_physics(self):
+        rigid_bodies = self.world.get_rigid_bodies()
+        ghosts = self.world.get_ghosts()
+
+        return {
+            'rigid_bodies': len(rigid_bodies),
+            'soft_bodies': self.world.get_num_soft_bodies(),
+            'ghosts': len(ghosts),
+            'constraints': self.world.get_num_constraints(),
+            'shapes': sum(body.get_num_shapes() for body in [*rigid_bodies, *ghosts])
+        }
+
+    def begin(self, name, category='phase'):
+        if not self.enabled:
+            return
+
+        self.stack.append({
+            'name': name,
+            'category': category,
+            'depth': len(self.stack),
+            'start': time.perf_counter(),
+            'memory': tracemalloc.get_traced_memory()[0],
+            'physics': self.count_physics(),
+            'flatten_time': 0,
+            'flatten_count': 0
+        })
+
+    def end(self):
+        if not self.enabled or not self.stack:
+            return
+
+        phase = self.stack.pop()
+        memory, physics = phase.pop('memory'), phase.pop('physics')
+
+        phase['time'] = time.perf_counter() - phase['start']
+        phase['start'] -= self.started
+        phase['allocated'] = tracemalloc.get_traced_memory()[0] - memory
+        phase.update({k: v - physics[k] for k, v in self.count_physics().items()})
+        self.phases.append(phase)
+
+    @contextmanager
+    def phase(self, name, category='phase'):
+        self.begin(name, category)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def add_flatten_time(self, elapsed):
+        """Add the time of a flatten_strong call to all of the phases in progress.
+        """
+        for phase in self.stack:
+            phase['flatten_time'] += elapsed
+            phase['flatten_count'] += 1
+
+    def summarize_buildings(self):
+        buildings = dict()
+
+        for phase in self.phases:
+            # the buildings built progressively are made in a 'building' phase,
+            # and built in 'building_step' phases over frames.
+            if phase['category'] not in ('building', 'building_step'):
+                continue
+
+            summary = buildings.setdefault(phase['name'], {'count': 0})
+            summary['count'] += phase['category'] == 'building'
+            for key in ['time', 'allocated', 'flatten_time', 'flatten_count',
+                        'rigid_bodies', 'soft_bodies', 'ghosts', 'constraints', 'shapes']:
+                summary[key] = summary.get(key, 0) + phase[key]
+
+        return buildings
+
+    def finish(self):
+        """Write the report; the phases not ended yet are not included.
+        """
+        if not self.enabled:
+            return
+
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report = {
+            'total_time': time.perf_counter() - self.started,
+            'peak_allocated': peak,
+            'physics': self.count_physics(),
+            'phases': sorted(self.phases, key=lambda p: p['start']),
+            'buildings': self.summarize_buildings()
+        }
+
+        with open(self.report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+        self.started = None
+        return report
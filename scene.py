@@ -1,17 +1,23 @@
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import deque
 from enum import Enum, auto
 
-from panda3d.bullet import BulletRigidBodyNode
-from panda3d.bullet import BulletHeightfieldShape, ZUp
 from panda3d.core import NodePath, PandaNode
 from panda3d.core import Vec3, Point3, LColor
-from panda3d.core import Filename
-from panda3d.core import PNMImage
-from panda3d.core import ShaderTerrainMesh, Shader, load_prc_file_data
+from panda3d.core import ShaderTerrainMesh, load_prc_file_data
+from panda3d.core import ConfigVariableString, ConfigVariableBool, ConfigVariableDouble, Filename
 from panda3d.core import SamplerState
 from panda3d.core import CardMaker, TextureStage, Texture
+from panda3d.core import Camera, OrthographicLens, FrameBufferProperties
 from panda3d.core import TransparencyAttrib
 from direct.interval.LerpInterval import LerpTexOffsetInterval
+from direct.showbase.DirectObject import DirectObject
 
+from assets import resolve, AssetRegistry, AssetKinds
 from buildings import (
     StoneHouse,
     BrickHouse,
@@ -22,9 +28,17 @@ from buildings import (
     AdventureBridge,
     MazeHouse,
     ElevatorTower,
-    TextureImages
+    TextureImages,
+    Buildings
 )
-from constants import Mask
+from impostors import ImpostorManager
+from materials import MaterialPacker, is_packing_enabled
+from profiler import StartupProfiler
+from shader_cache import ShaderCache
+from terrain import HeightfieldAsset, TerrainPager, ChunkedTerrainMesh, is_terrain_on_cpu
+from visibility import RoomVisibility
+from utils import supports_shaders
+from zones import ZoneManager
 
 
 load_prc_file_data("", """
@@ -36,6 +50,29 @@ load_prc_file_data("", """
     stm-max-chunk-count 2048""")
 
 
+# the directory of the tiles written by terrains/make_image.py; one heightfield is used if empty.
+terrain_tiles = ConfigVariableString('terrain-tiles', '')
+
+# the bam file of the built buildings; loaded if made from the same sources, buildings and packing,
+# otherwise written after building.
+world_snapshot = ConfigVariableString('world-snapshot', '')
+# the sources whose changes make the snapshot stale.
+SNAPSHOT_SOURCES = [
+    'buildings.py', 'blueprint.py', 'automatic_doors.py', 'elevator.py',
+    'create_geomnode.py', 'create_softbody.py'
+]
+
+# the buildings within build-near-radius of the focus are built at once, and the others are built
+# nearest first in the following frames, spending build-frame-budget seconds in a frame.
+progressive_build = ConfigVariableBool('progressive-build', True)
+build_near_radius = ConfigVariableDouble('build-near-radius', 40)
+build_frame_budget = ConfigVariableDouble('build-frame-budget', 0.008)
+
+# the fireworks are drawn at fireworks-scale of the window resolution, fireworks-fps times a second.
+fireworks_scale = ConfigVariableDouble('fireworks-scale', 0.5)
+fireworks_fps = ConfigVariableDouble('fireworks-fps', 30)
+
+
 class Skies(Enum):
 
     DAY = auto()
@@ -44,32 +81,37 @@ class Skies(Enum):
 
 class Sky(NodePath):
 
+    DAY_MODEL = 'models/blue-sky/blue-sky-sphere'
+    NIGHT_MODEL = 'models/night-stars/stars'
+
     def __init__(self):
         super().__init__(PandaNode('sky'))
-        self.blue_sky = base.loader.load_model('models/blue-sky/blue-sky-sphere')
-        self.night_sky = base.loader.load_model('models/night-stars/stars') 
-
         base.set_background_color(0, 0, 0, 1)
         self.set_shader_off()
         self.model = None
+        self.model_path = None
 
     def set_model(self, sky_type):
-        """Change models.
+        """Change models. The model is acquired from AssetRegistry when used,
+           and released when changed, so that the unused one can be unloaded.
             Args:
                 sky_type (Skies):
         """
         if self.model:
             self.model.detach_node()
+            AssetRegistry().release(AssetKinds.MODEL, self.model_path)
 
         match sky_type:
             case Skies.DAY:
-                self.model = self.blue_sky
+                self.model_path = self.DAY_MODEL
+                self.model = AssetRegistry().acquire(AssetKinds.MODEL, self.model_path)
                 self.model.set_color(2, 2, 2, 1)
                 self.model.set_scale(0.2)
                 self.model.set_z(0)
 
             case Skies.NIGHT:
-                self.model = self.night_sky
+                self.model_path = self.NIGHT_MODEL
+                self.model = AssetRegistry().acquire(AssetKinds.MODEL, self.model_path)
                 self.model.set_color(2, 2, 2, 1)
                 self.model.set_scale(0.3)
                 self.model.set_z(-50)
@@ -77,14 +119,65 @@ class Sky(NodePath):
         self.model.reparent_to(self)
 
 
-class TerrainShape(NodePath):
+class Fireworks(NodePath):
+    """Draw the fireworks on a full screen card into an offscreen buffer smaller than the window,
+       and only at the intervals of the fireworks fps. The buffer texture is upscaled and added to
+       the stars by the night sky shader.
+       Args:
+            shader (Shader): the shader drawing the fireworks;
+            scale (float): the ratio of the buffer size to the window size; fireworks-scale if None;
+            fps (float): how many times a second the buffer is drawn; fireworks-fps if None;
+    """
+
+    def __init__(self, shader, scale=None, fps=None):
+        super().__init__(PandaNode('fireworks'))
+        self.scale = fireworks_scale.get_value() if scale is None else scale
+        fps = fireworks_fps.get_value() if fps is None else fps
+        self.window_size = size = base.win.get_size()
+
+        # the light of the fireworks is tone mapped after added to the stars.
+        fb_props = FrameBufferProperties()
+        fb_props.set_rgba_bits(16, 16, 16, 0)
+        fb_props.set_float_color(True)
+
+        self.texture = Texture('fireworks')
+        self.buffer = base.win.make_texture_buffer('fireworks', *self.get_buffer_size(size), self.texture, fbp=fb_props)
+        self.buffer.set_sort(-10)
+
+        lens = OrthographicLens()
+        lens.set_film_size(2, 2)
+        lens.set_near_far(-1, 1)
+        camera = self.attach_new_node(Camera('fireworks_camera', lens))
+        self.buffer.make_display_region().set_camera(camera)
+
+        card = CardMaker('fireworks_card')
+        card.set_frame_fullscreen_quad()
+        self.card = self.attach_new_node(card.generate())
+        self.card.set_shader(shader)
+        self.card.set_shader_input('u_resolution', size)
+
+        self.buffer.set_one_shot(True)
+        base.taskMgr.do_method_later(1 / fps, self.update, 'update_fireworks')
+
+    def get_buffer_size(self, window_size):
+        return max(int(window_size.x * self.scale), 1), max(int(window_size.y * self.scale), 1)
+
+    def set_window_size(self, size):
+        """Resize the buffer to the scale of the window size, and draw it again.
+        """
+        self.window_size = size
+        self.buffer.set_size(*self.get_buffer_size(size))
+        self.card.set_shader_input('u_resolution', size)
+        self.buffer.set_one_shot(True)
+
+    def update(self, task):
+        self.buffer.set_one_shot(True)
+        return task.again
 
-    def __init__(self, img):
-        super().__init__(BulletRigidBodyNode('terrain_shape'))
-        shape = BulletHeightfieldShape(img, 10, ZUp)
-        self.node().add_shape(shape)
-        self.node().set_mass(0)
-        self.set_collide_mask(Mask.ground)
+    def destroy(self):
+        base.taskMgr.remove('update_fireworks')
+        base.graphicsEngine.remove_window(self.buffer)
+        self.remove_node()
 
 
 class Water(NodePath):
@@ -96,87 +189,399 @@ class Water(NodePath):
         self.surface = self.attach_new_node(card.generate())
         self.surface.look_at(Vec3.down())
         self.surface.set_transparency(TransparencyAttrib.MAlpha)
-        self.surface.set_texture(base.loader.load_texture(TextureImages.WATER.path))
+        self.surface.set_texture(base.loader.load_texture(resolve(TextureImages.WATER.path)))
         self.surface.set_tex_scale(TextureStage.get_default(), 4)
 
 
 class Scene(NodePath):
 
-    def __init__(self, world, ambient_light, directional_light):
+    TERRAIN_SHADER = ('shaders/terrain.vert.glsl', 'shaders/terrain.frag.glsl')
+    TERRAIN_TILE_SHADER = ('shaders/terrain_tile.vert.glsl', 'shaders/terrain.frag.glsl')
+    FIREWORKS_SHADER = ('shaders/fireworks_v.glsl', 'shaders/fireworks_f.glsl')
+    NIGHT_SKY_SHADER = ('shaders/fireworks_v.glsl', 'shaders/night_sky_f.glsl')
+
+    BUILDINGS = [
+        (StoneHouse, Point3(38, 75, 1), 0),
+        (BrickHouse, Point3(50, -27, 0), -45),
+        (Terrace, Point3(1, 1, -2), -180),
+        (Observatory, Point3(-80, 80, -2.5), 45),
+        (Bridge, Point3(38, 43, 1), 0),
+        (Tunnel, Point3(-45, -68, 3), 222),
+        (AdventureBridge, Point3(92, -29, -1), 0),
+        (MazeHouse, Point3(-24, 87, -1.5), 0),
+        (ElevatorTower, Point3(87, 23, -3.5))
+    ]
+
+    def __init__(self, world, focus=None):
+        """Make the physics of the scene, which needs no assets loaded in the background:
+           the collision shape of the terrain and the bodies of the buildings.
+           The rest is made by setup after the assets are loaded.
+        """
         super().__init__(PandaNode('scene'))
         self.reparent_to(base.render)
         self.world = world
+        self.size = 256  # size of terrain and water
+        self.focus = base.camera if focus is None else focus
+        self.unbuilt_buildings = []
+
+        self.terrains = NodePath('terrain')
+        self.terrains.reparent_to(self)
+
+        # the tiles of a tiled terrain are streamed with their collision shapes by TerrainPager.
+        if not terrain_tiles.get_value():
+            with StartupProfiler().phase('terrain_shape'):
+                self.make_terrain_shape('terrains/heightfield7.png')
+
+        # the bodies of the buildings come with them if they are loaded from a snapshot.
+        if not os.path.isfile(world_snapshot.get_value()):
+            self.make_building_bodies()
+
+    def setup(self, ambient_light, directional_light):
         self.ambient_light = ambient_light
         self.directional_light = directional_light
-        self.size = 256  # size of terrain and water
 
         # make sky
-        self.sky = Sky()
-        self.sky.reparent_to(self)
-        self.sky.set_model(Skies.DAY)
+        with StartupProfiler().phase('sky'):
+            self.sky = Sky()
+            self.sky.reparent_to(self)
+            self.sky.set_model(Skies.DAY)
+            self.fireworks = None
+            # the fireworks buffer and the night sky follow the size of the window.
+            self.window_events = DirectObject()
+            self.window_events.accept('window-event', self.resize_window)
 
         # make terrain
-        self.terrains = NodePath('terrain')
-        self.terrains.reparent_to(self)
-        self.make_terrain('terrains/heightfield7.png')
+        with StartupProfiler().phase('terrain'):
+            if tiles_dir := terrain_tiles.get_value():
+                self.make_tiled_terrain(tiles_dir, self.focus)
+                pos = Point3(*self.terrain.get_bottom_left(), 0)
+            else:
+                self.make_terrain()
+                pos = self.terrain.get_pos()
 
         # make water
         self.water = Water(self.size)
-        pos = self.terrain.get_pos()
         pos.z = -3
         self.water.reparent_to(self)
         self.water.set_pos(pos)
         LerpTexOffsetInterval(self.water.surface, 200, (1, 0), (0, 0)).loop()
 
         # make buildings
-        self.make_buildings()
+        with StartupProfiler().phase('buildings'):
+            self.zones = ZoneManager(self.world, self.focus)
+            self.impostors = ImpostorManager()
+            self.visibility = RoomVisibility(self.world, self.zones)
+            self.building_instances = []
+            self.pending_buildings = deque()
+            # the building being built progressively, and the generator of its build steps.
+            self.building_steps = None
+
+            if (snapshot := world_snapshot.get_value()) and (buildings := self.read_snapshot(snapshot)):
+                self.load_snapshot(buildings)
+                base.messenger.send('buildings_built')
+            else:
+                self.make_buildings()
+
+        with StartupProfiler().phase('shaders'):
+            self.warm_up_shaders()
+
+    def make_building_bodies(self):
+        """Make the buildings and the bodies of their blueprints, which are built by make_buildings.
+        """
+        self.buildings = NodePath('buildings')
+        self.buildings.reparent_to(self)
+
+        for building_cls, *args in self.BUILDINGS:
+            with StartupProfiler().phase(building_cls.__name__, 'building'):
+                building = building_cls(self.world, self.buildings, *args)
+                building.make_bodies()
+                self.unbuilt_buildings.append(building)
 
     def make_buildings(self):
-        self.buildings = NodePath('buildings')
+        """Build the buildings nearest to the focus first. In the progressive build, only the ones
+           near the focus are built here, and the others in the task 'build_progressively'.
+        """
+        # the snapshot expected to be loaded may have been made from other sources.
+        if not self.unbuilt_buildings:
+            self.make_building_bodies()
+
+        focus_pos = self.focus.get_pos(self)
+        buildings = sorted(self.unbuilt_buildings, key=lambda b: (b.get_pos(self) - focus_pos).length())
+        self.unbuilt_buildings.clear()
+
+        for building in buildings:
+            if progressive_build.get_value() and \
+                    (building.get_pos(self) - focus_pos).length() > build_near_radius.get_value():
+                self.pending_buildings.append(building)
+            else:
+                self.build(building)
+
+        if self.pending_buildings:
+            base.taskMgr.add(self.build_progressively, 'build_progressively')
+        else:
+            self.finish_buildings()
+
+    def build_progressively(self, task):
+        """Take the build steps of the pending buildings until the time budget of this frame
+           runs out; at least one step is taken in a frame. A step builds a group of parts.
+        """
+        start = time.perf_counter()
+
+        while self.pending_buildings or self.building_steps:
+            if self.building_steps is None:
+                building = self.pending_buildings.popleft()
+                self.building_steps = (building, self.construct(building))
+
+            building, steps = self.building_steps
+
+            with StartupProfiler().phase(building.__class__.__name__, 'building_step'):
+                try:
+                    next(steps)
+                except StopIteration:
+                    self.building_steps = None
+
+            if time.perf_counter() - start >= build_frame_budget.get_value():
+                break
+
+        if self.pending_buildings or self.building_steps:
+            return task.cont
+
+        self.warm_up_shaders(self.buildings)
+        self.finish_buildings()
+        return task.done
+
+    def finish_buildings(self):
+        if snapshot := world_snapshot.get_value():
+            self.save_snapshot(snapshot)
+
+        base.messenger.send('buildings_built')
+
+    def build(self, building):
+        with StartupProfiler().phase(building.__class__.__name__, 'building'):
+            for _ in self.construct(building):
+                pass
+
+    def construct(self, building):
+        """Build a building a group of parts at a step, then pack it and register it with
+           the impostors and the zones in the following steps.
+        """
+        yield from building.build()
+
+        if is_packing_enabled():
+            MaterialPacker().pack(building)
+            yield
+
+        self.impostors.register(building)
+        yield
+
+        self.building_instances.append(building)
+        self.visibility.register(self.zones.register(building))
+
+    def get_snapshot_key(self):
+        """Return the hash of the sources of the buildings, the list of the buildings and
+           whether the materials are packed, which the snapshot must have been made from.
+        """
+        key = hashlib.sha1()
+
+        for path in [*SNAPSHOT_SOURCES, *sorted(glob.glob('blueprints/*.json'))]:
+            with open(path, 'rb') as f:
+                key.update(path.encode())
+                key.update(f.read())
+
+        for building_cls, *args in self.BUILDINGS:
+            key.update(repr((building_cls.__name__, *args)).encode())
+
+        key.update(str(is_packing_enabled()).encode())
+        return key.hexdigest()
+
+    def read_snapshot(self, path):
+        """Return the buildings of the snapshot, or None if the snapshot does not exist or
+           was made from other sources, buildings or packing.
+        """
+        if not os.path.isfile(path):
+            return None
+
+        buildings = base.loader.load_model(path, noCache=True)
+
+        if buildings.get_tag('snapshot_key') != self.get_snapshot_key():
+            buildings.remove_node()
+            return None
+
+        return buildings
+
+    def save_snapshot(self, path):
+        """Write the buildings with their rigid bodies and shapes into a bam file. The constraints,
+           sensors, knobs, elevators, tasks and soft bodies, which bam cannot keep, are written as json
+           into the tags of the buildings, and remade when loaded.
+        """
+        detached = []
+        # the stashed buildings would be loaded stashed.
+        inactive_zones = [zone for zone in self.zones.zones if not zone.active]
+
+        for zone in inactive_zones:
+            zone.activate()
+
+        # the atlases are baked again when loaded.
+        self.impostors.detach()
+
+        for building in self.building_instances:
+            building.set_tag('links', json.dumps(building.describe_links()))
+
+            # ghosts are remade by the links; they cannot be loaded without their python classes.
+            # neither can the bodies of the knobs under the bodies of the doors be completed by bam.
+            for link in building.links:
+                if link['type'] in ('sensor', 'knob'):
+                    obj = link['obj']
+                    detached.append((obj, obj.get_parent()))
+                    obj.detach_node()
+
+        # bam cannot keep the shader and the texture array of the packed buildings.
+        for building in self.building_instances:
+            MaterialPacker().unbind(building)
+
+        self.buildings.set_tag('snapshot_key', self.get_snapshot_key())
+        self.buildings.write_bam_file(Filename(path))
+
+        for building in self.building_instances:
+            MaterialPacker().bind(building)
+
+        for obj, parent in detached:
+            obj.reparent_to(parent)
+
+        self.impostors.attach()
+
+        for zone in inactive_zones:
+            zone.deactivate()
+
+    def load_snapshot(self, buildings):
+        self.buildings = buildings
         self.buildings.reparent_to(self)
 
-        StoneHouse(self.world, self.buildings, Point3(38, 75, 1), 0).build()
-        BrickHouse(self.world, self.buildings, Point3(50, -27, 0), -45).build()
-        Terrace(self.world, self.buildings, Point3(1, 1, -2), -180).build()
-        Observatory(self.world, self.buildings, Point3(-80, 80, -2.5), 45).build()
-        Bridge(self.world, self.buildings, Point3(38, 43, 1), 0).build()
-        Tunnel(self.world, self.buildings, Point3(-45, -68, 3), 222).build()
-        AdventureBridge(self.world, self.buildings, Point3(92, -29, -1), 0).build()
-        MazeHouse(self.world, self.buildings, Point3(-24, 87, -1.5), 0).build()
-        ElevatorTower(self.world, self.buildings, Point3(87, 23, -3.5)).build()
-
-    def make_terrain(self, img_file):
-        img = PNMImage(Filename(img_file))
-        terrain_shape = TerrainShape(img)
+        for body in self.buildings.find_all_matches('**/+BulletRigidBodyNode'):
+            self.world.attach(body.node())
+
+        for nd in self.buildings.find_all_matches('**/=links'):
+            with StartupProfiler().phase(nd.get_name(), 'building'):
+                building = Buildings.load(self.world, nd)
+                MaterialPacker().bind(building)
+                self.impostors.register(building)
+                self.building_instances.append(building)
+                self.visibility.register(self.zones.register(building))
+
+    def make_terrain_shape(self, img_file):
+        self.heightfield = HeightfieldAsset(img_file)
+        terrain_shape = self.heightfield.make_shape()
         terrain_shape.reparent_to(self.terrains)
         self.world.attach(terrain_shape.node())
 
+    def make_terrain(self):
+        offset = self.heightfield.size / 2.0 - 0.5
+
+        if is_terrain_on_cpu():
+            # the samples are put at the integers, so the mesh lies on the collision shape.
+            self.terrain = ChunkedTerrainMesh(self.heightfield, base.camera)
+            self.terrain.reparent_to(self.terrains)
+            self.terrain.set_pos(-offset, -offset, -10 / 2.0)
+            self.terrain.refresh()
+            self.set_terrain_shader(self.terrain)
+            return
+
         terrain_node = ShaderTerrainMesh()
-        heightfield = base.loader.load_texture(img_file)
-        heightfield.wrap_u = SamplerState.WM_clamp
-        heightfield.wrap_v = SamplerState.WM_clamp
-        terrain_node.heightfield = heightfield
+        terrain_node.heightfield = self.heightfield.texture
         terrain_node.target_triangle_width = 10.0
         terrain_node.generate()
 
         self.terrain = self.terrains.attach_new_node(terrain_node)
+        self.terrain.set_shader_input('normal_map', self.heightfield.load_normal_map())
         self.terrain.set_scale(self.size, self.size, 10)
-        offset = img.get_x_size() / 2.0 - 0.5
         self.terrain.set_pos(-offset, -offset, -10 / 2.0)  # terrain bottom left. terrain_pos LPoint3f(-127.5, -127.5, -5)
+        self.set_terrain_shader(self.terrain)
+
+    def make_tiled_terrain(self, tiles_dir, focus):
+        """Stream the tiles of a terrain larger than one heightfield around the focus.
+           Args:
+                tiles_dir (str): the directory with manifest.json;
+                focus (NodePath): the tiles around this are loaded;
+        """
+        self.terrain = TerrainPager(self.world, tiles_dir, focus)
+        self.terrain.reparent_to(self.terrains)
+        self.terrain.load_around()
+        self.size = self.terrain.size
+        self.set_terrain_shader(self.terrain, self.TERRAIN_TILE_SHADER)
+
+    def set_terrain_shader(self, terrain, shader=TERRAIN_SHADER):
+        # the meshes made on CPU are drawn with the fixed-function pipeline or the auto-shader.
+        if not is_terrain_on_cpu():
+            terrain.set_shader(ShaderCache().load(shader))
+            terrain.set_shader_input("camera", base.camera)
+
+        self.grass_tex = base.loader.load_texture(resolve(TextureImages.GRASS.path))
+        self.grass_tex.setMinfilter(SamplerState.FT_linear_mipmap_linear)
+        self.grass_tex.set_anisotropic_degree(16)
+        terrain.set_texture(self.grass_tex)
+
+    def warm_up_shaders(self, root=None):
+        """Compile the terrain and fireworks shaders, and generate the auto-shaders of the render
+           states under the root both with and without the shadows of the day light, which are
+           turned off at night and in the low quality.
+           Args:
+                root (NodePath): the render states under this are walked; render if None;
+        """
+        if root is None:
+            root = base.render
+
+        cache = ShaderCache()
+
+        if supports_shaders():
+            cache.load(self.FIREWORKS_SHADER)
+            cache.load(self.NIGHT_SKY_SHADER)
+        color = self.directional_light.node().get_color()
+
+        for brightness in (LColor(0, 0, 0, 1), color):
+            self.directional_light.set_brightness(brightness)
+            cache.warm_up(root)
+
+    def set_terrain_quality(self, target_triangle_width):
+        """Change the level of detail of the terrain meshes.
+        """
+        for nd in self.terrains.find_all_matches('**/+ShaderTerrainMesh'):
+            nd.node().target_triangle_width = target_triangle_width
 
-        terrain_shader = Shader.load(Shader.SL_GLSL, "shaders/terrain.vert.glsl", "shaders/terrain.frag.glsl")
-        self.terrain.set_shader(terrain_shader)
-        self.terrain.set_shader_input("camera", base.camera)
-        grass_tex = base.loader.load_texture(TextureImages.GRASS.path)
-        grass_tex.setMinfilter(SamplerState.FT_linear_mipmap_linear)
-        grass_tex.set_anisotropic_degree(16)
-        self.terrain.set_texture(grass_tex)
+        if isinstance(self.terrain, ChunkedTerrainMesh):
+            self.terrain.target_triangle_width = target_triangle_width
+
+        if isinstance(self.terrain, TerrainPager):
+            self.terrain.target_triangle_width = target_triangle_width
+
+            for tile in self.terrain.tiles.values():
+                if isinstance(tile.mesh, ChunkedTerrainMesh):
+                    tile.mesh.target_triangle_width = target_triangle_width
+
+    def set_anisotropic_degree(self, anisotropic_degree):
+        """Change the filtering of the grass and of the texture array of the packed buildings.
+        """
+        self.grass_tex.set_anisotropic_degree(anisotropic_degree)
+
+        if is_packing_enabled():
+            MaterialPacker().texture.set_anisotropic_degree(anisotropic_degree)
+
+    def resize_window(self, window):
+        if window != base.win or not self.fireworks:
+            return
+
+        if (size := window.get_size()) != self.fireworks.window_size:
+            self.fireworks.set_window_size(size)
+            self.sky.set_shader_input('u_resolution', size)
 
     def change_sky(self, sky_type):
         match sky_type:
             case Skies.DAY:
-                if self.sky.get_shader():
-                    self.sky.clear_shader()
+                # the sky is not lit by the auto-shader.
+                self.sky.set_shader_off()
+
+                if self.fireworks:
+                    self.fireworks.destroy()
+                    self.fireworks = None
 
                 self.sky.set_model(sky_type)
                 self.directional_light.set_brightness()
@@ -185,16 +590,21 @@ class Scene(NodePath):
                 self.sky.set_model(sky_type)
                 self.directional_light.set_brightness(LColor(0, 0, 0, 1))
 
-                self.sky.set_shader(
-                    Shader.load(Shader.SL_GLSL, 'shaders/fireworks_v.glsl', 'shaders/fireworks_f.glsl'))
-                props = base.win.get_properties()
-                self.sky.set_shader_input('u_resolution', props.get_size())
-                tex = Texture()
-                self.sky.set_shader_input('tex', tex)
+                # only the stars are drawn where the window cannot run the shaders.
+                if supports_shaders():
+                    if not self.fireworks:
+                        self.fireworks = Fireworks(ShaderCache().load(self.FIREWORKS_SHADER))
+
+                    self.sky.set_shader(ShaderCache().load(self.NIGHT_SKY_SHADER))
+                    self.sky.set_shader_input('u_resolution', base.win.get_size())
+                    self.sky.set_shader_input('fireworks', self.fireworks.texture)
 
             case _:
                 raise InvalidSkyError(sky_type)
 
+        # the cards of the impostors are not lit; they are baked again under the changed lights.
+        self.impostors.rebake()
+
 
 class InvalidSkyError(Exception):
 
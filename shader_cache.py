@@ -0,0 +1,76 @@
+"""Compile the shaders before they are drawn, so that the play does not stall for compiling them.
+
+The shader programs loaded from files are kept by the paths, and prepared on the graphics state
+guardian at once. The auto-shaders are generated lazily when a render state is drawn for the first
+time, so the unique render states of the geoms in the scene graph are drawn in one frame at startup.
+The shader generator keeps the shaders by the shader keys of the states, so the states which appear
+later with the same kinds of materials and lights reuse them instead of new ones.
+"""
+from panda3d.core import ConfigVariableBool
+from panda3d.core import Shader, CardMaker
+
+from utils import singleton
+
+
+shader_warm_up = ConfigVariableBool('shader-warm-up', True)
+# keep the compiled programs in the model cache, so that the later runs do not compile them again.
+cache_compiled_shaders = ConfigVariableBool('cache-compiled-shaders', True)
+
+
+@singleton
+class ShaderCache:
+
+    def __init__(self):
+        self.shaders = dict()
+
+    def load(self, paths):
+        """Return the shader of the paths, loading it if it is not loaded yet.
+           Args:
+                paths (tuple): the vertex and fragment shader paths;
+        """
+        if (shader := self.shaders.get(paths)) is None:
+            shader = Shader.load(Shader.SL_GLSL, *paths)
+            shader.set_cache_compiled_shader(cache_compiled_shaders.get_value())
+            self.shaders[paths] = shader
+
+        return shader
+
+    def get_render_states(self, root):
+        """Return the unique net render states of the geoms under the root.
+        """
+        states = set()
+
+        for geom_np in root.find_all_matches('**/+GeomNode'):
+            net_state = geom_np.get_net_state()
+            node = geom_np.node()
+
+            for i in range(node.get_num_geoms()):
+                states.add(net_state.compose(node.get_geom_state(i)))
+
+        return states
+
+    def warm_up(self, *roots):
+        """Compile the loaded shaders, and generate and compile the auto-shaders of the render
+           states under the roots by drawing a tiny card with each of the states in one frame.
+           Return the number of the render states.
+           Args:
+                roots (NodePath): the scene graphs whose render states are walked;
+        """
+        if not shader_warm_up.get_value() or (gsg := base.win.get_gsg()) is None:
+            return 0
+
+        for shader in self.shaders.values():
+            shader.prepare(gsg.get_prepared_objects())
+
+        states = set().union(*[self.get_render_states(root) for root in roots])
+        cards = base.camera.attach_new_node('shader_warm_up')
+        cards.set_y(base.camLens.get_near() * 2)
+        maker = CardMaker('card')
+        maker.set_frame(-0.001, 0.001, -0.001, 0.001)
+
+        for state in states:
+            cards.attach_new_node(maker.generate()).set_state(state)
+
+        base.graphicsEngine.render_frame()
+        cards.remove_node()
+        return len(states)
@@ -0,0 +1,44 @@
+#version 150
+
+// The fragment shader of the buildings packed by MaterialPacker. The textures are sampled from
+// the layers of the texture array, and lit by the ambient light and the day light with its shadows
+// like the auto-shader.
+
+in vec3 view_pos;
+in vec3 view_normal;
+in vec4 vtx_color;
+in vec3 tex_coord;
+out vec4 color;
+
+uniform sampler2DArray p3d_Texture0;
+uniform vec4 p3d_ColorScale;
+
+uniform struct {
+  vec4 ambient;
+} p3d_LightModel;
+
+// the day light; the position of a directional light is the direction to the light.
+uniform struct {
+  vec4 color;
+  vec4 position;
+  sampler2DShadow shadowMap;
+  mat4 shadowViewMatrix;
+} p3d_LightSource[1];
+
+
+void main() {
+  vec4 albedo = texture(p3d_Texture0, tex_coord) * vtx_color * p3d_ColorScale;
+  vec3 normal = normalize(view_normal);
+
+  // the walls of the blueprints are two-sided
+  if (!gl_FrontFacing) {
+    normal = -normal;
+  }
+
+  float diffuse = max(dot(normal, normalize(p3d_LightSource[0].position.xyz)), 0.0);
+  float shadow = textureProj(p3d_LightSource[0].shadowMap,
+                             p3d_LightSource[0].shadowViewMatrix * vec4(view_pos, 1.0));
+
+  vec3 light = p3d_LightModel.ambient.rgb + p3d_LightSource[0].color.rgb * diffuse * shadow;
+  color = vec4(albedo.rgb * light, albedo.a);
+}
@@ -0,0 +1,27 @@
+#version 150
+
+// The vertex shader of the buildings packed by MaterialPacker. The texture matrices are already
+// applied to the texture coordinates, and the layer of the texture array is in the column 'layer'.
+
+in vec4 p3d_Vertex;
+in vec3 p3d_Normal;
+in vec4 p3d_Color;
+in vec2 p3d_MultiTexCoord0;
+in float layer;
+
+uniform mat4 p3d_ModelViewProjectionMatrix;
+uniform mat4 p3d_ModelViewMatrix;
+uniform mat3 p3d_NormalMatrix;
+
+out vec3 view_pos;
+out vec3 view_normal;
+out vec4 vtx_color;
+out vec3 tex_coord;
+
+void main() {
+  gl_Position = p3d_ModelViewProjectionMatrix * p3d_Vertex;
+  view_pos = (p3d_ModelViewMatrix * p3d_Vertex).xyz;
+  view_normal = p3d_NormalMatrix * p3d_Normal;
+  vtx_color = p3d_Color;
+  tex_coord = vec3(p3d_MultiTexCoord0, layer);
+}
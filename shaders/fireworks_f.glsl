@@ -2,7 +2,6 @@
 precision highp float;
 uniform vec2 u_resolution;
 uniform float osg_FrameTime;
-uniform sampler2D p3d_Texture0;
 in vec2 texcoord;
 out vec4 fragColor;
 
@@ -45,8 +44,9 @@ vec3 lastExplosion(float time) {
 
 
 void main() {
-    vec2 uv = (2. * gl_FragCoord.xy - u_resolution.xy) / u_resolution.y;
-    vec3 col = texture(p3d_Texture0, texcoord).rgb;
+    // drawn on a full screen card of an offscreen buffer; u_resolution is the size of the window.
+    vec2 uv = (2. * texcoord * u_resolution.xy - u_resolution.xy) / u_resolution.y;
+    vec3 col = vec3(0.);
 
     vec3 last_expl = lastExplosion(osg_FrameTime);
     float t = last_expl.x;
@@ -76,8 +76,6 @@ void main() {
         col += glow(uv, lpos) * intensity * base_col;
     }
 
-    col = max(col, 0.);
-    col = (col*(2.51*col+0.03))/(col*(2.43*col+0.59)+0.14);
-    col = sqrt(col);  // gamma correction
+    // the light is added to the stars and tone mapped by the night sky shader.
     fragColor = vec4(col, 1.);
 }
\ No newline at end of file
@@ -0,0 +1,18 @@
+#version 300 es
+precision highp float;
+uniform vec2 u_resolution;
+uniform sampler2D p3d_Texture0;
+uniform sampler2D fireworks;
+in vec2 texcoord;
+out vec4 fragColor;
+
+void main() {
+    // the fireworks are drawn into a smaller buffer, and upscaled by the linear filter.
+    vec3 col = texture(p3d_Texture0, texcoord).rgb;
+    col += texture(fireworks, gl_FragCoord.xy / u_resolution.xy).rgb;
+
+    col = max(col, 0.);
+    col = (col*(2.51*col+0.03))/(col*(2.43*col+0.59)+0.14);
+    col = sqrt(col);  // gamma correction
+    fragColor = vec4(col, 1.);
+}
@@ -0,0 +1,457 @@
+import json
+import math
+import os
+from collections import deque
+
+import numpy as np
+from panda3d.bullet import BulletRigidBodyNode
+from panda3d.bullet import BulletHeightfieldShape, ZUp
+from panda3d.core import NodePath, PandaNode
+from panda3d.core import Filename, PNMImage
+from panda3d.core import ShaderTerrainMesh, SamplerState, Texture
+from panda3d.core import ConfigVariableString, ConfigVariableInt, ConfigVariableDouble
+from panda3d.core import Geom, GeomVertexFormat, GeomVertexArrayFormat, InternalName
+
+from blueprint import make_geom_node
+from constants import Mask
+from utils import supports_shaders
+
+
+# 'shader' draws the terrain by ShaderTerrainMesh, 'cpu' by ChunkedTerrainMesh, which needs no shaders;
+# 'auto' chooses 'cpu' if the graphics card cannot run shaders, like tinydisplay.
+terrain_mesh = ConfigVariableString('terrain-mesh', 'auto')
+# the chunks of terrain-chunk-size cells are drawn with all of the samples within terrain-lod-distance
+# of the camera, and with every second sample within twice the distance, and so on for terrain-lod-levels.
+terrain_chunk_size = ConfigVariableInt('terrain-chunk-size', 32)
+terrain_lod_levels = ConfigVariableInt('terrain-lod-levels', 4)
+terrain_lod_distance = ConfigVariableDouble('terrain-lod-distance', 32)
+
+
+def is_terrain_on_cpu():
+    """Return True if the terrain meshes are made on CPU instead of by ShaderTerrainMesh.
+    """
+    match terrain_mesh.get_value():
+        case 'cpu':
+            return True
+        case 'shader':
+            return False
+        case _:
+            return not supports_shaders()
+
+
+class HeightfieldAsset:
+    """Decode a 16-bit heightfield image once, and share the decoded RAM image among
+       the ShaderTerrainMesh, the Bullet heightfield and the height sampling on CPU.
+       Args:
+            path (str): the path of the heightfield image;
+            max_height (float): the height of the samples of 65535;
+    """
+
+    def __init__(self, path, max_height=10):
+        self.path = path
+        self.max_height = max_height
+        self.texture = Texture(os.path.basename(path))
+        self.texture.set_keep_ram_image(True)
+
+        if not self.texture.read(Filename(path)):
+            raise OSError(f'Cannot read the heightfield {path}.')
+
+        self.texture.wrap_u = SamplerState.WM_clamp
+        self.texture.wrap_v = SamplerState.WM_clamp
+
+        # a view of the RAM image without copy; the rows are stored from the bottom of the image.
+        ram = np.frombuffer(self.texture.get_ram_image(), dtype=np.uint16)
+        self.heights = ram.reshape(self.texture.get_y_size(), self.texture.get_x_size())
+
+    @property
+    def size(self):
+        return self.texture.get_x_size()
+
+    def load_normal_map(self):
+        """Return the normal map baked next to the heightfield by terrains/make_image.py.
+        """
+        stem = os.path.splitext(self.path)[0]
+        tex = Texture(f'{os.path.basename(stem)}_normal')
+
+        if not tex.read(Filename(f'{stem}_normal.png')):
+            raise OSError(f'Cannot read the normal map of {self.path}; bake it by terrains/make_image.py.')
+
+        tex.wrap_u = SamplerState.WM_clamp
+        tex.wrap_v = SamplerState.WM_clamp
+        return tex
+
+    def make_shape(self, name='terrain_shape'):
+        # BulletHeightfieldShape made from a Texture interpolates between the texels,
+        # so copy the RAM image into a PNMImage, which is freed after the shape is made.
+        img = PNMImage()
+        self.texture.store(img)
+        return TerrainShape(img, self.max_height, name)
+
+    def crop_texture(self, size, name):
+        """Return a texture of the top-left size x size samples.
+        """
+        tex = Texture(name)
+        tex.setup_2d_texture(size, size, Texture.T_unsigned_short, Texture.F_luminance)
+        tex.set_ram_image(np.ascontiguousarray(self.heights[-size:, :size]))
+        tex.wrap_u = SamplerState.WM_clamp
+        tex.wrap_v = SamplerState.WM_clamp
+        return tex
+
+    def height_at(self, x, y):
+        """Return the bilinearly interpolated height at x and y, which are relative to
+           the center of the heightfield, in the same way as TerrainShape.
+        """
+        rows, cols = self.heights.shape
+        u = np.clip(x + (cols - 1) / 2, 0, cols - 1)
+        v = np.clip(y + (rows - 1) / 2, 0, rows - 1)
+        c0, r0 = min(int(u), cols - 2), min(int(v), rows - 2)
+        fu, fv = u - c0, v - r0
+
+        h = self.heights[r0:r0 + 2, c0:c0 + 2].astype(np.float32)
+        height = (h[0, 0] * (1 - fu) + h[0, 1] * fu) * (1 - fv) + (h[1, 0] * (1 - fu) + h[1, 1] * fu) * fv
+        # Bullet puts the middle of 0 and max_height at the center of the shape.
+        return float(height) / 65535 * self.max_height - self.max_height / 2
+
+
+class TerrainShape(NodePath):
+
+    def __init__(self, heightfield, max_height=10, name='terrain_shape'):
+        super().__init__(BulletRigidBodyNode(name))
+        shape = BulletHeightfieldShape(heightfield, max_height, ZUp)
+        self.node().add_shape(shape)
+        self.node().set_mass(0)
+        self.set_collide_mask(Mask.ground)
+
+
+class ChunkedTerrainMesh(NodePath):
+    """A terrain mesh made from the heightfield on CPU, which is drawn without shaders.
+       The heightfield is divided into square chunks, and each chunk is made of every 2^level-th
+       sample, the level growing with the distance from the focus. Only the chunks whose level
+       changed are made again. The edges of adjacent chunks of different levels do not meet,
+       so the chunks have skirts hanging down from the edges to hide the cracks.
+       The samples are put at the integer x and y from the origin, the bottom left of the heightfield.
+       Args:
+            asset (HeightfieldAsset): the heightfield;
+            focus (NodePath): the level of the chunks is chosen by the distance from this;
+            chunk_size (int): the number of the cells on a side of a chunk; terrain-chunk-size if None;
+            levels (int): the number of the levels of detail; terrain-lod-levels if None;
+            tex_repeat (float): the number of the times the texture repeats across the heightfield;
+    """
+
+    def __init__(self, asset, focus, chunk_size=None, levels=None, tex_repeat=16):
+        super().__init__(PandaNode('chunked_terrain'))
+        self.asset = asset
+        self.focus = focus
+        self.chunk_size = terrain_chunk_size.get_value() if chunk_size is None else chunk_size
+        self.levels = terrain_lod_levels.get_value() if levels is None else levels
+        self.lod_distance = terrain_lod_distance.get_value()
+        self.vertex_format = self.make_vertex_format()
+
+        rows, cols = asset.heights.shape
+        self.z = asset.heights.astype(np.float32) * (asset.max_height / 65535)
+        self.normals = self.get_normals(self.z)
+        self.uv = np.stack(np.meshgrid(np.arange(cols) / (cols - 1), np.arange(rows) / (rows - 1)), axis=-1)
+        self.uv *= tex_repeat
+
+        # the first sample of the chunks; the last ones share the last samples with the next chunks.
+        self.starts = [np.arange(0, n - 1, self.chunk_size) for n in (rows, cols)]
+        self.chunks = np.full((len(self.starts[0]), len(self.starts[1])), NodePath(), dtype=object)
+        self.chunk_levels = np.full(self.chunks.shape, -1)
+
+        starts = np.meshgrid(self.starts[0], self.starts[1], indexing='ij')
+        self.centers = np.stack([
+            np.minimum(starts[1] + self.chunk_size / 2, (cols - 1 + starts[1]) / 2),
+            np.minimum(starts[0] + self.chunk_size / 2, (rows - 1 + starts[0]) / 2)
+        ], axis=-1)
+
+        self.task = base.taskMgr.add(self.update, f'update_{self.get_name()}_{id(self)}')
+
+    @property
+    def target_triangle_width(self):
+        return self.lod_distance * 10.0 / terrain_lod_distance.get_value()
+
+    @target_triangle_width.setter
+    def target_triangle_width(self, width):
+        """Map the target triangle width of ShaderTerrainMesh to the distance of the levels;
+           the default 10 pixels to terrain-lod-distance.
+        """
+        self.lod_distance = terrain_lod_distance.get_value() * 10.0 / width
+
+    @staticmethod
+    def make_vertex_format():
+        array = GeomVertexArrayFormat()
+        array.add_column(InternalName.get_vertex(), 3, Geom.NT_float32, Geom.C_point)
+        array.add_column(InternalName.get_normal(), 3, Geom.NT_float32, Geom.C_normal)
+        array.add_column(InternalName.get_texcoord(), 2, Geom.NT_float32, Geom.C_texcoord)
+        return GeomVertexFormat.register_format(array)
+
+    @staticmethod
+    def get_normals(z):
+        """Return the normals of the samples.
+        """
+        dy, dx = np.gradient(z)
+        normals = np.stack([-dx, -dy, np.ones_like(z)], axis=-1)
+        normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+        return normals
+
+    def get_samples(self, start, step, n):
+        """Return every step-th index from start to the end of a chunk, with the end.
+        """
+        end = min(start + self.chunk_size, n - 1)
+        return np.append(np.arange(start, end, step), end)
+
+    def build_chunk(self, i, j, level):
+        """Return the vertices and indices of a chunk made of every 2^level-th sample.
+        """
+        rows, cols = self.z.shape
+        r = self.get_samples(self.starts[0][i], 2 ** level, rows)
+        c = self.get_samples(self.starts[1][j], 2 ** level, cols)
+        nr, nc = len(r), len(c)
+
+        rr, cc = np.meshgrid(r, c, indexing='ij')
+        grid = np.concatenate([
+            np.stack([cc, rr, self.z[rr, cc]], axis=-1),
+            self.normals[rr, cc],
+            self.uv[rr, cc]
+        ], axis=-1).reshape(-1, 8)
+
+        idx = np.arange(nr * nc).reshape(nr, nc)
+        v00, v01, v10, v11 = idx[:-1, :-1], idx[:-1, 1:], idx[1:, :-1], idx[1:, 1:]
+        quads = np.stack([v00, v01, v11, v00, v11, v10], axis=-1).reshape(-1)
+
+        # the edge in counterclockwise order, and the skirt below it deep enough to cover
+        # the heights between the samples left out.
+        ring = np.concatenate([idx[0, :-1], idx[:-1, -1], idx[-1, :0:-1], idx[:0:-1, 0]])
+        chunk_z = self.z[r[0]:r[-1] + 1, c[0]:c[-1] + 1]
+        skirt = grid[ring].copy()
+        skirt[:, 2] = chunk_z.min() - 1
+
+        a = ring
+        b = np.roll(ring, -1)
+        a_low = np.arange(len(ring)) + len(grid)
+        b_low = np.roll(a_low, -1)
+        walls = np.stack([a, a_low, b_low, a, b_low, b], axis=-1).reshape(-1)
+
+        return np.concatenate([grid, skirt]), np.concatenate([quads, walls])
+
+    def rebuild(self, i, j, level):
+        vertices, indices = self.build_chunk(i, j, level)
+        geom_node = make_geom_node(f'terrain_chunk_{i}_{j}', self.vertex_format, vertices, indices)
+        if not self.chunks[i, j].is_empty():
+            self.chunks[i, j].remove_node()
+
+        self.chunks[i, j] = self.attach_new_node(geom_node)
+        self.chunk_levels[i, j] = level
+
+    def get_levels(self):
+        """Return the levels of the chunks by the distances from the focus.
+        """
+        pos = self.focus.get_pos(self)
+        dist = np.hypot(*(self.centers - (pos.x, pos.y)).transpose(2, 0, 1))
+        dist = np.hypot(dist, pos.z)
+        # 0 within lod_distance, 1 within twice of it, 2 within 4 times, ...
+        levels = np.floor(np.log2(np.maximum(dist, 1e-3) / self.lod_distance)) + 1
+        return np.clip(levels, 0, min(self.levels - 1, int(math.log2(self.chunk_size)))).astype(int)
+
+    def refresh(self):
+        """Make the chunks whose level changed again; return the number of them.
+           Called every frame, and once after the mesh is put in the scene before the first frame.
+        """
+        levels = self.get_levels()
+        changed = np.argwhere(levels != self.chunk_levels)
+
+        for i, j in changed:
+            self.rebuild(i, j, levels[i, j])
+
+        return len(changed)
+
+    def update(self, task):
+        self.refresh()
+        return task.cont
+
+    def destroy(self):
+        base.taskMgr.remove(self.task)
+        self.remove_node()
+
+
+class TerrainTile(NodePath):
+    """A square part of a large terrain, which has its own collision shape and ShaderTerrainMesh.
+       Adjacent tiles share one row or column of samples, so a tile of 2^n + 1 samples spans 2^n units.
+       ShaderTerrainMesh needs 2^n x 2^n samples, so its heightfield lacks one row and column and only
+       bounds the chunks; the tile shader samples the heights from all of the samples, like the collision shape.
+       Args:
+            key (tuple): (row, column) of the tile;
+            asset (HeightfieldAsset): the heightfield of the tile;
+    """
+
+    def __init__(self, key, asset):
+        super().__init__(PandaNode(f'terrain_tile_{key[0]}_{key[1]}'))
+        self.key = key
+        self.asset = asset
+        self.span = asset.size - 1
+        self.max_height = asset.max_height
+
+        self.shape = asset.make_shape(f'terrain_shape_{key[0]}_{key[1]}')
+        self.shape.reparent_to(self)
+        self.heightfield = asset.crop_texture(self.span, f'heightfield_{key[0]}_{key[1]}')
+        self.normal_map = asset.load_normal_map()
+
+    def generate(self, target_triangle_width=10.0):
+        """Make the ShaderTerrainMesh, or the ChunkedTerrainMesh if the terrain is made on CPU.
+           Must be called in the main thread.
+        """
+        half = self.span / 2
+
+        if is_terrain_on_cpu():
+            # the chunked mesh uses all of the samples, because it is not sampled like a texture.
+            self.mesh = ChunkedTerrainMesh(self.asset, base.camera)
+            self.mesh.target_triangle_width = target_triangle_width
+            self.mesh.reparent_to(self)
+            self.mesh.set_pos(-half, -half, -self.max_height / 2)
+            return
+
+        terrain_node = ShaderTerrainMesh()
+        terrain_node.heightfield = self.heightfield
+        terrain_node.target_triangle_width = target_triangle_width
+        # the default chunk size 32 is too large for small tiles.
+        terrain_node.chunk_size = min(terrain_node.chunk_size, self.span // 4)
+        terrain_node.generate()
+
+        # the tile shader samples the heights from all of the span + 1 samples, whose texel
+        # centers are put on the samples of the collision shape.
+        self.mesh = self.attach_new_node(terrain_node)
+        self.mesh.set_shader_input('tile_heightfield', self.asset.texture)
+        self.mesh.set_shader_input('normal_map', self.normal_map)
+        self.mesh.set_scale(self.span + 1, self.span + 1, self.max_height)
+        self.mesh.set_pos(-half - 0.5, -half - 0.5, -self.max_height / 2)
+
+    def destroy(self):
+        if isinstance(self.mesh, ChunkedTerrainMesh):
+            self.mesh.destroy()
+        self.remove_node()
+
+
+class TerrainPager(NodePath):
+    """Keep the heightfield tiles in a ring around the focus loaded, and unload the others.
+       Tiles are read in a thread, and attached to the BulletWorld and the scene graph in the main thread.
+       Args:
+            world (BulletWorld): bullet world
+            tiles_dir (str): the directory with manifest.json, written by terrains/make_image.py;
+            focus (NodePath): the tiles are loaded around this; mostly the character or the camera;
+            radius (int): the number of tiles loaded on each side of the tile with the focus;
+            max_tiles (int): the maximum number of tiles kept loaded;
+            max_height (float): the height of the samples of 65535;
+            level (int): the mip level of the tiles;
+    """
+
+    def __init__(self, world, tiles_dir, focus, radius=1, max_tiles=16, max_height=10, level=0):
+        super().__init__(PandaNode('terrain_pager'))
+        self.world = world
+        self.focus = focus
+        self.radius = radius
+        self.max_tiles = max(max_tiles, (2 * radius + 1) ** 2)
+        self.max_height = max_height
+        self.target_triangle_width = 10.0
+
+        with open(os.path.join(tiles_dir, 'manifest.json')) as f:
+            manifest = json.load(f)
+
+        self.tiles_dir = os.path.join(tiles_dir, f'level{level}')
+        self.step = manifest['tile_size'] - 1
+        self.rows, self.cols = manifest['levels'][level]['size']
+        self.tile_rows, self.tile_cols = manifest['levels'][level]['tiles']
+
+        # the world position of the sample at row 0 and column 0; the terrain is centered at the origin.
+        self.left = -(self.cols - 1) / 2
+        self.top = (self.rows - 1) / 2
+
+        self.tiles = dict()
+        self.requested = set()
+        self.loaded = deque()
+
+        base.taskMgr.setupTaskChain('terrain_loading', numThreads=1)
+        base.taskMgr.add(self.update, 'terrain_pager')
+
+    @property
+    def size(self):
+        return max(self.rows, self.cols)
+
+    def get_bottom_left(self):
+        return self.left, self.top - (self.rows - 1)
+
+    def get_tile_key(self, pos):
+        col = int((pos.x - self.left) // self.step)
+        row = int((self.top - pos.y) // self.step)
+        return row, col
+
+    def get_tile_center(self, key):
+        row, col = key
+        return self.left + (col + 0.5) * self.step, self.top - (row + 0.5) * self.step
+
+    def find_wanted_keys(self):
+        focus_row, focus_col = self.get_tile_key(self.focus.get_pos(base.render))
+        return set(
+            (row, col)
+            for row in range(focus_row - self.radius, focus_row + self.radius + 1)
+            for col in range(focus_col - self.radius, focus_col + self.radius + 1)
+            if 0 <= row < self.tile_rows and 0 <= col < self.tile_cols
+        )
+
+    def read_tile(self, key):
+        row, col = key
+        asset = HeightfieldAsset(os.path.join(self.tiles_dir, f'tile_{row}_{col}.png'), self.max_height)
+        return TerrainTile(key, asset)
+
+    def load_tile(self, key):
+        """Read a tile in the thread of the task chain.
+        """
+        self.loaded.append(self.read_tile(key))
+
+    def attach_tile(self, tile):
+        self.requested.discard(tile.key)
+        if tile.key in self.tiles:
+            return
+
+        tile.generate(self.target_triangle_width)
+        tile.set_pos(*self.get_tile_center(tile.key), 0)
+        tile.reparent_to(self)
+        self.world.attach(tile.shape.node())
+        self.tiles[tile.key] = tile
+
+    def detach_tile(self, key):
+        tile = self.tiles.pop(key)
+        self.world.remove(tile.shape.node())
+        tile.destroy()
+
+    def load_around(self):
+        """Load the tiles around the focus synchronously; used before the first frame
+           so that the focus does not fall through the terrain.
+        """
+        for key in self.find_wanted_keys():
+            if key not in self.tiles:
+                self.attach_tile(self.read_tile(key))
+
+    def evict(self, wanted):
+        if (over := len(self.tiles) - self.max_tiles) <= 0:
+            return
+
+        focus_pos = self.focus.get_pos(base.render).xy
+        candidates = [key for key in self.tiles if key not in wanted]
+        candidates.sort(key=lambda k: (focus_pos - self.get_tile_center(k)).length_squared(), reverse=True)
+
+        for key in candidates[:over]:
+            self.detach_tile(key)
+
+    def update(self, task):
+        wanted = self.find_wanted_keys()
+
+        for key in wanted - self.tiles.keys() - self.requested:
+            self.requested.add(key)
+            base.taskMgr.add(self.load_tile, f'load_terrain_tile_{key[0]}_{key[1]}',
+                             extraArgs=[key], taskChain='terrain_loading')
+
+        while self.loaded:
+            self.attach_tile(self.loaded.popleft())
+
+        self.evict(wanted)
+        return task.cont
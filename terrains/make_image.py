@@ -1,16 +1,229 @@
+"""Convert elevation data into 16-bit heightfield images.
+
+The input is read in chunks of rows, or memory-mapped, so that elevation data larger than memory
+can be converted. Heights are normalized by the global minimum and maximum, and written into
+square tiles sharing their edges with the neighbouring tiles, with a mip pyramid of the tiles.
+A normal map is baked next to each heightfield image for the terrain shader.
+
+    >>>python make_image.py 6561.txt --dest tiles --tile-size 129
+    >>>python make_image.py 6561.txt --single heightfield.png
+    >>>python make_image.py heightfield7.png --maps
+"""
+import argparse
+import json
+import os
+
 import imageio
 
 import pandas as pd
 import numpy as np
 
 
-def make_image(filepath, dest_filepath):
-    df = pd.read_csv(filepath, header=None)
-    arr = df.values
-    arr = np.interp(arr, (arr.min(), arr.max()), (0, 65536))
-    arr = arr.astype(np.uint16)
-    imageio.imwrite(dest_filepath, arr)
+MAX_HEIGHT = 65535
+
+# the scale of the normalized heights when computing normals, which the terrain shader used to use.
+NORMAL_HEIGHT_SCALE = 50
+
+
+def read_chunks(filepath, chunk_rows=256, shape=None):
+    """Yield blocks of rows of the elevation data.
+       Args:
+            filepath (str): csv or txt (comma separated), npy or r16 (raw little-endian uint16);
+            chunk_rows (int): the number of rows read at once;
+            shape (tuple): (rows, cols) of the r16 file; regarded as square if None;
+    """
+    match os.path.splitext(filepath)[1].lower():
+        case '.npy':
+            arr = np.load(filepath, mmap_mode='r')
+        case '.r16' | '.raw':
+            if shape is None:
+                side = int(np.sqrt(os.path.getsize(filepath) // 2))
+                shape = (side, side)
+            arr = np.memmap(filepath, dtype='<u2', mode='r', shape=shape)
+        case _:
+            for chunk in pd.read_csv(filepath, header=None, chunksize=chunk_rows, dtype=np.float64):
+                yield chunk.values
+            return
+
+    for start in range(0, arr.shape[0], chunk_rows):
+        yield np.asarray(arr[start:start + chunk_rows], dtype=np.float64)
+
+
+def scan(filepath, chunk_rows=256, shape=None):
+    """Return the global minimum, maximum and the shape of the elevation data.
+    """
+    low, high = np.inf, -np.inf
+    rows, cols = 0, None
+
+    for chunk in read_chunks(filepath, chunk_rows, shape):
+        low = min(low, chunk.min())
+        high = max(high, chunk.max())
+        rows += chunk.shape[0]
+        cols = chunk.shape[1]
+
+    return low, high, (rows, cols)
+
+
+def normalize(filepath, dest_filepath, chunk_rows=256, shape=None):
+    """Write the elevation data scaled into 0 - 65535 to a memory-mapped npy file, and return it.
+    """
+    low, high, size = scan(filepath, chunk_rows, shape)
+    heights = np.lib.format.open_memmap(dest_filepath, mode='w+', dtype=np.uint16, shape=size)
+    scale = MAX_HEIGHT / (high - low) if high > low else 0
+    row = 0
+
+    for chunk in read_chunks(filepath, chunk_rows, shape):
+        heights[row:row + len(chunk)] = np.rint((chunk - low) * scale).astype(np.uint16)
+        row += len(chunk)
+
+    heights.flush()
+    return heights, (low, high)
+
+
+def downsample(heights, dest_filepath, chunk_rows=256):
+    """Write the heights filtered by [1, 2, 1] / 4 and decimated by 2 to a memory-mapped npy file,
+       and return it. Every other sample is kept, so the edges shared by tiles stay shared.
+    """
+    rows, cols = heights.shape
+    size = ((rows - 1) // 2 + 1, (cols - 1) // 2 + 1)
+    dest = np.lib.format.open_memmap(dest_filepath, mode='w+', dtype=np.uint16, shape=size)
+
+    for start in range(0, size[0], chunk_rows):
+        end = min(start + chunk_rows, size[0])
+        # the source rows 2r - 1, 2r, 2r + 1 for the output rows r; clamped at the borders.
+        src_rows = np.clip(np.arange(2 * start - 1, 2 * end), 0, rows - 1)
+        src = np.asarray(heights[src_rows], dtype=np.float64)
+        src = (src[0:-2:2] + 2 * src[1:-1:2] + src[2::2]) / 4
+
+        padded = np.pad(src, ((0, 0), (1, 1)), mode='edge')
+        src = (padded[:, 0:-2] + 2 * padded[:, 1:-1] + padded[:, 2:]) / 4
+        dest[start:end] = np.rint(src[:, ::2]).astype(np.uint16)
+
+    dest.flush()
+    return dest
+
+
+def read_window(heights, row, col, size, margin=0):
+    """Return size x size heights from row and col with margin on each side; padded by the edges outside.
+    """
+    rows = np.clip(np.arange(row - margin, row + size + margin), 0, heights.shape[0] - 1)
+    cols = np.clip(np.arange(col - margin, col + size + margin), 0, heights.shape[1] - 1)
+    block = np.asarray(heights[rows[0]:rows[-1] + 1])
+    return block[rows - rows[0]][:, cols]
+
+
+def bake_normal_map(heights, spacing=1):
+    """Return the normal map (rows, cols, 3) in uint8.
+       Args:
+            heights (numpy.ndarray): heights of 0 - 65535 with a margin of one sample on each side;
+            spacing (float): the distance between samples in the world;
+    """
+    h = np.asarray(heights, dtype=np.float64) / MAX_HEIGHT
+    # the rows of images go to -y in the world.
+    dx = (h[1:-1, 2:] - h[1:-1, :-2]) / spacing
+    dy = (h[:-2, 1:-1] - h[2:, 1:-1]) / spacing
+
+    normals = np.dstack([-dx * NORMAL_HEIGHT_SCALE, -dy * NORMAL_HEIGHT_SCALE, np.ones_like(dx)])
+    normals /= np.linalg.norm(normals, axis=-1, keepdims=True)
+    return np.rint((normals * 0.5 + 0.5) * 255).astype(np.uint8)
+
+
+def write_normal_map(heights, dest_filepath, spacing=1):
+    """Write the normal map next to the heightfield image of dest_filepath.
+       Args:
+            heights (numpy.ndarray): heights with a margin of one sample on each side;
+    """
+    stem = os.path.splitext(dest_filepath)[0]
+    imageio.imwrite(f'{stem}_normal.png', bake_normal_map(heights, spacing))
+
+
+def write_tiles(heights, dest_dir, tile_size, spacing=1):
+    """Write the heights into square tiles of tile_size, and return the number of tiles in rows and columns.
+       Adjacent tiles share one row or column of samples; the tiles on the borders are padded by the edges.
+       The maps of a tile cover the tile_size - 1 samples rendered by the tile, without the shared last ones.
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    step = tile_size - 1
+    rows, cols = heights.shape
+    tile_rows = max((rows - 2) // step + 1, 1)
+    tile_cols = max((cols - 2) // step + 1, 1)
+
+    for i in range(tile_rows):
+        for j in range(tile_cols):
+            tile_filepath = os.path.join(dest_dir, f'tile_{i}_{j}.png')
+            imageio.imwrite(tile_filepath, read_window(heights, i * step, j * step, tile_size))
+            write_normal_map(read_window(heights, i * step, j * step, step, margin=1), tile_filepath, spacing)
+
+    return tile_rows, tile_cols
+
+
+def make_tiles(filepath, dest_dir, tile_size=257, levels=None, chunk_rows=256, shape=None):
+    """Convert the elevation data into tiles with a mip pyramid, and write manifest.json,
+       which describes them, into dest_dir.
+       Args:
+            tile_size (int): the number of samples on a side of a tile; 2^n + 1 keeps the mip levels aligned;
+            levels (int): the number of mip levels; until a level fits in one tile if None;
+    """
+    os.makedirs(dest_dir, exist_ok=True)
+    heights, (low, high) = normalize(filepath, os.path.join(dest_dir, 'level0.npy'), chunk_rows, shape)
+    manifest = {
+        'source': os.path.basename(filepath),
+        'size': list(heights.shape),
+        'tile_size': tile_size,
+        'min': float(low),
+        'max': float(high),
+        'levels': []
+    }
+
+    level = 0
+    while True:
+        tile_rows, tile_cols = write_tiles(heights, os.path.join(dest_dir, f'level{level}'), tile_size, 2 ** level)
+        manifest['levels'].append({'size': list(heights.shape), 'tiles': [tile_rows, tile_cols]})
+        level += 1
+
+        if level == levels or (levels is None and tile_rows == tile_cols == 1):
+            break
+        heights = downsample(heights, os.path.join(dest_dir, f'level{level}.npy'), chunk_rows)
+
+    with open(os.path.join(dest_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return manifest
+
+
+def make_image(filepath, dest_filepath, chunk_rows=256, shape=None):
+    """Convert the elevation data into one heightfield image.
+    """
+    tmp_filepath = f'{os.path.splitext(dest_filepath)[0]}.npy'
+    heights, _ = normalize(filepath, tmp_filepath, chunk_rows, shape)
+    imageio.imwrite(dest_filepath, np.asarray(heights))
+    write_normal_map(np.pad(heights, 1, mode='edge'), dest_filepath)
+    del heights
+    os.remove(tmp_filepath)
+
+
+def make_normal_map(img_filepath):
+    """Bake the normal map of an existing heightfield image.
+    """
+    heights = imageio.imread(img_filepath)
+    write_normal_map(np.pad(heights, 1, mode='edge'), img_filepath)
 
 
 if __name__ == '__main__':
-    make_image('6519.txt', 'heightfield.png')
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Convert elevation data into 16-bit heightfield images.')
+    parser.add_argument('src', help='csv, txt, npy or r16 file')
+    parser.add_argument('--dest', default='tiles', help='the directory the tiles are written into')
+    parser.add_argument('--single', help='write one heightfield image to this path instead of tiles')
+    parser.add_argument('--maps', action='store_true', help='bake only the normal map of the heightfield image src')
+    parser.add_argument('--tile-size', type=int, default=257)
+    parser.add_argument('--levels', type=int)
+    parser.add_argument('--chunk-rows', type=int, default=256)
+    parser.add_argument('--shape', type=int, nargs=2, help='rows and columns of a r16 file')
+    args = parser.parse_args()
+
+    if args.maps:
+        make_normal_map(args.src)
+    elif args.single:
+        make_image(args.src, args.single, args.chunk_rows, args.shape)
+    else:
+        make_tiles(args.src, args.dest, args.tile_size, args.levels, args.chunk_rows, args.shape)
@@ -18,6 +18,14 @@ def create_line_node(from_pos, to_pos, color, thickness=2.0):
     return NodePath(node)
 
 
+def supports_shaders():
+    """Return True if the window can run the GLSL shaders; False on software renderers
+       like tinydisplay. Assumed True before the window is opened.
+    """
+    gsg = base.win.get_gsg() if base.win else None
+    return gsg is None or gsg.get_supports_basic_shaders()
+
+
 def singleton(cls):
     instances = {}
 
@@ -0,0 +1,181 @@
+import numpy as np
+
+from direct.showbase.ShowBaseGlobal import globalClock
+from panda3d.core import Vec3, Point3
+
+from constants import Config
+
+
+class VerletRopes:
+    """Simulate many decorative ropes together as one Verlet system with distance constraints,
+       instead of making a BulletSoftBodyNode for each rope. The ends of a rope are fixed at
+       a point in the world or attached to rigid bodies, and a stretched rope pulls the
+       attached bodies by impulses. The ropes do not collide with anything.
+       Args:
+            world (BulletWorld): bullet world
+            num_nodes (int): the number of nodes of each rope;
+            iterations (int): the number of times the distance constraints are solved per step;
+            damping (float): the ratio of the velocity kept every step;
+            stiffness (float): the spring constant of the ropes pulling the attached bodies;
+            tension_damping (float): the damping of the attached bodies moving along the ropes;
+            time_step (float): the fixed time step, which should be the same as that of BulletWorld.do_physics;
+    """
+
+    def __init__(self, world, num_nodes, iterations=10, damping=0.98, stiffness=500, tension_damping=10,
+                 time_step=1 / 60):
+        self.world = world
+        self.num_nodes = num_nodes
+        self.iterations = iterations
+        self.damping = damping
+        self.stiffness = stiffness
+        self.tension_damping = tension_damping
+        self.time_step = time_step
+        self.elapsed_time = 0
+        self.gravity = np.array([0, 0, Config.gravity], dtype=np.float32)
+
+        self.pos = np.zeros((0, num_nodes, 3), dtype=np.float32)
+        self.prev = self.pos.copy()
+        self.inv_mass = np.zeros((0, num_nodes), dtype=np.float32)
+        self.rest = np.zeros(0, dtype=np.float32)
+
+        # anchors of the both ends; body index is -1 if the end is fixed at a point in the world.
+        self.bodies = []
+        self.anchor_bodies = np.zeros((0, 2), dtype=np.int32)
+        self.anchor_pts = np.zeros((0, 2, 3), dtype=np.float32)
+
+        self.start()
+
+    def __len__(self):
+        return len(self.pos)
+
+    def start(self):
+        self.task = base.taskMgr.add(self.update, 'verlet_ropes', sort=-1)
+
+    def stop(self):
+        base.taskMgr.remove(self.task)
+
+    def body_index(self, body):
+        if body is None:
+            return -1
+
+        if body not in self.bodies:
+            self.bodies.append(body)
+        return self.bodies.index(body)
+
+    def add_rope(self, from_pt, to_pt, from_body=None, to_body=None):
+        """Add a rope from from_pt to to_pt.
+           Args:
+                from_pt (Point3): the world position where the rope starts;
+                to_pt (Point3): the world position where the rope ends;
+                from_body (NodePath): the body the start is attached to; fixed at from_pt if None;
+                to_body (NodePath): the body the end is attached to; fixed at to_pt if None;
+        """
+        start = np.array(from_pt, dtype=np.float32)
+        end = np.array(to_pt, dtype=np.float32)
+        t = np.linspace(0, 1, self.num_nodes, dtype=np.float32)[:, np.newaxis]
+        pts = start + (end - start) * t
+
+        anchor_pts = []
+        for pt, body in [(from_pt, from_body), (to_pt, to_body)]:
+            # the points attached to bodies are kept in the local coordinates of the bodies.
+            if body is not None:
+                pt = body.get_relative_point(base.render, pt)
+            anchor_pts.append(tuple(pt))
+
+        inv_mass = np.ones(self.num_nodes, dtype=np.float32)
+        inv_mass[[0, -1]] = 0
+
+        self.pos = np.concatenate([self.pos, pts[np.newaxis]])
+        self.prev = np.concatenate([self.prev, pts[np.newaxis]])
+        self.inv_mass = np.concatenate([self.inv_mass, inv_mass[np.newaxis]])
+        self.rest = np.append(self.rest, np.linalg.norm(end - start) / (self.num_nodes - 1)).astype(np.float32)
+
+        anchor_bodies = [self.body_index(from_body), self.body_index(to_body)]
+        self.anchor_bodies = np.concatenate([self.anchor_bodies, np.array([anchor_bodies], dtype=np.int32)])
+        self.anchor_pts = np.concatenate([self.anchor_pts, np.array([anchor_pts], dtype=np.float32)])
+
+    def get_positions(self):
+        return self.pos
+
+    def get_anchor_positions(self):
+        """Return the world positions of the both ends; shape (ropes, 2, 3).
+        """
+        pts = self.anchor_pts.copy()
+
+        if self.bodies:
+            mats = np.array([body.get_mat(base.render) for body in self.bodies], dtype=np.float32)
+            attached = self.anchor_bodies >= 0
+            idx = self.anchor_bodies[attached]
+            local = pts[attached]
+            pts[attached] = np.einsum('ni,nij->nj', local, mats[idx, :3, :3]) + mats[idx, 3, :3]
+
+        return pts
+
+    def solve(self, anchors):
+        """Solve the distance constraints of all ropes at the same time.
+        """
+        w = self.inv_mass
+        w_sum = np.maximum(w[:, :-1] + w[:, 1:], 1e-6)[..., np.newaxis]
+        rest = self.rest[:, np.newaxis, np.newaxis]
+
+        for _ in range(self.iterations):
+            self.pos[:, 0] = anchors[:, 0]
+            self.pos[:, -1] = anchors[:, 1]
+
+            diff = self.pos[:, 1:] - self.pos[:, :-1]
+            length = np.maximum(np.linalg.norm(diff, axis=-1, keepdims=True), 1e-6)
+            delta = diff * (1 - rest / length) / w_sum
+            self.pos[:, :-1] += delta * w[:, :-1, np.newaxis]
+            self.pos[:, 1:] -= delta * w[:, 1:, np.newaxis]
+
+        self.pos[:, 0] = anchors[:, 0]
+        self.pos[:, -1] = anchors[:, 1]
+
+    def pull_bodies(self, anchors, dt):
+        """Apply impulses to the attached bodies if the ropes are stretched.
+        """
+        lengths = np.linalg.norm(self.pos[:, 1:] - self.pos[:, :-1], axis=-1)
+        stretch = lengths.sum(axis=1) - self.rest * (self.num_nodes - 1)
+
+        for end, neighbor in [(0, 1), (1, -2)]:
+            idx = self.anchor_bodies[:, end]
+            diff = self.pos[:, neighbor] - anchors[:, end]
+            length = np.maximum(np.linalg.norm(diff, axis=-1), 1e-6)
+
+            for i in np.nonzero((idx >= 0) & (stretch > 0))[0]:
+                body = self.bodies[idx[i]]
+                direction = Vec3(*(diff[i] / length[i]))
+                rel_pos = Point3(*anchors[i, end]) - body.get_pos(base.render)
+
+                # damp the velocity of the anchor point along the rope to prevent bouncing.
+                velocity = body.node().get_linear_velocity() + \
+                    body.node().get_angular_velocity().cross(rel_pos)
+                tension = max(self.stiffness * stretch[i] - self.tension_damping * velocity.dot(direction), 0)
+
+                body.node().set_active(True)
+                body.node().apply_impulse(direction * tension * dt, rel_pos)
+
+    def step(self, dt):
+        if not len(self):
+            return
+
+        velocity = (self.pos - self.prev) * self.damping
+        self.prev = self.pos.copy()
+        self.pos += velocity + self.inv_mass[..., np.newaxis] * self.gravity * dt ** 2
+
+        anchors = self.get_anchor_positions()
+        self.solve(anchors)
+        self.pull_bodies(anchors, dt)
+
+    def update(self, task):
+        """Step at most once per frame at the fixed time step, in the same way as
+           BulletWorld.do_physics(dt) with max_substeps 1, so that the impulses are
+           applied once per substep of the rigid bodies.
+        """
+        self.elapsed_time += globalClock.get_dt()
+
+        if (steps := int(self.elapsed_time / self.time_step)) > 0:
+            self.elapsed_time -= steps * self.time_step
+            self.step(self.time_step)
+
+        return task.cont
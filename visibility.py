@@ -0,0 +1,320 @@
+"""Hide the interiors of the rooms and the buildings which cannot be seen from where the camera is.
+
+A room is the floor named 'room_*' with its room camera. The blueprint of a building lists its rooms
+with their portals, the openings like doors and open tops, and the parts in the interior of each room,
+which are merged into nodes of their own by Buildings.instantiate so that flatten_strong keeps them apart.
+Every frame, the rooms seen from the cell of the camera, outdoors or the room it is in, are found
+by going through the portals in the view frustum, and the interiors of the others are hidden; so
+the interiors of a building are hidden while the camera is outside it and sees none of its openings.
+A portal out of the cell of the camera is passed only from its side of the portal.
+
+The buildings are culled as a whole while the camera is in a room. The potentially visible set of
+a room is found by casting rays from the positions of the room camera in the directions spread evenly
+over a sphere. A ray is blocked when it hits a visible body of the building of the room before
+it leaves the bounds of the building; the rays which escape are the views through the doors
+and windows. A building is visible if any escaping ray points into the cone around it, widened
+by the angle between the rays, so that a building seen only through a small opening is not hidden.
+The rays of the rooms are cast in the frames after their buildings are registered, within a time budget
+of a frame, and the room the camera enters is cast first; nothing is hidden from a room until its rays are cast.
+"""
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from panda3d.core import Point3, BoundingBox, ConfigVariableDouble, ConfigVariableInt
+
+from constants import Mask
+
+
+# the rays of the rooms are cast spending pvs-frame-budget seconds in a frame, pvs-chunk rays at a time.
+pvs_frame_budget = ConfigVariableDouble('pvs-frame-budget', 0.003)
+pvs_chunk = ConfigVariableInt('pvs-chunk', 64)
+
+
+class Portals:
+    """The portals and interiors of the rooms of a building.
+       Args:
+            zone (Zone): the zone of the building;
+    """
+
+    # the portals are the unit boxes scaled to the openings.
+    UNIT_BOX = BoundingBox(Point3(-0.5, -0.5, -0.5), Point3(0.5, 0.5, 0.5))
+
+    def __init__(self, zone):
+        self.zone = zone
+        # (portal, room, the room on the other side or None for outdoors)
+        self.portals = [(nd, nd.get_tag('portal'), nd.get_tag('to') or None)
+                        for nd in zone.building.find_all_matches('**/=portal')]
+        self.interiors = dict()
+
+        for nd in zone.building.find_all_matches('**/=interior'):
+            self.interiors.setdefault(nd.get_tag('interior'), []).append(nd)
+
+        self.rooms = {room for _, room, _ in self.portals}
+
+    def sees_through(self, portal, lens_bounds, side=None):
+        """Return True if the portal is in the view frustum, and the camera is on the side
+           of the portal if given; True for the room, False for the other side.
+        """
+        if side is not None:
+            y = base.cam.get_y(portal)
+            # the camera in the opening sees through it from both sides.
+            if (y < -0.5) if side else (y > 0.5):
+                return False
+
+        bounds = lens_bounds.make_copy()
+        bounds.xform(base.cam.get_mat(portal))
+        return bool(bounds.contains(self.UNIT_BOX))
+
+    def find_visible_rooms(self, cell, lens_bounds):
+        """Return the rooms seen from the cell through the portals in the view frustum.
+           Args:
+                cell (str): the room the camera is in; None for outdoors;
+                lens_bounds (BoundingVolume): the view frustum of the camera;
+        """
+        start = cell if cell in self.rooms else None
+        visible = {start}
+        frontier = [start]
+
+        while frontier:
+            current = frontier.pop()
+
+            for portal, room, to in self.portals:
+                if current not in (room, to) or (other := to if current == room else room) in visible:
+                    continue
+
+                side = (current == room) if current == start else None
+
+                if self.sees_through(portal, lens_bounds, side):
+                    visible.add(other)
+                    frontier.append(other)
+
+        return visible
+
+    def cull(self, cell, lens_bounds):
+        visible = self.find_visible_rooms(cell, lens_bounds)
+
+        for room, interiors in self.interiors.items():
+            for interior in interiors:
+                if room in visible:
+                    interior.show()
+                else:
+                    interior.hide()
+
+
+class RoomVisibility:
+    """Args:
+            world (BulletWorld): bullet world;
+            zones (ZoneManager): the zones of the buildings;
+            samples (int): the number of the positions of a moving room camera;
+            directions (int): the number of the rays cast from a position;
+    """
+
+    def __init__(self, world, zones, samples=3, directions=2048):
+        self.world = world
+        self.zones = zones
+        self.samples = samples
+        self.directions = self.spread_directions(directions)
+        # the angle between the adjacent rays.
+        self.spacing = math.sqrt(4 * math.pi / directions)
+
+        # the eyes and the escaping directions of the rays from them by the room cameras.
+        self.escapes = dict()
+        # the room cameras whose rays are not cast yet, and the room camera being cast with its steps.
+        self.queue = deque()
+        self.casting = None
+
+        self.portals = []
+        self.room_camera = None
+        self.hidden = []
+        base.taskMgr.add(self.cull_interiors, 'cull_interiors')
+
+    @staticmethod
+    def spread_directions(n):
+        """Return n unit vectors spread evenly over a sphere on a Fibonacci lattice.
+        """
+        i = np.arange(n) + 0.5
+        z = 1 - 2 * i / n
+        r = np.sqrt(1 - z ** 2)
+        theta = np.pi * (1 + 5 ** 0.5) * i
+        return np.stack([r * np.cos(theta), r * np.sin(theta), z], axis=1)
+
+    def register(self, zone):
+        """Take the portals and the room cameras of the building of a zone registered with ZoneManager,
+           and start casting the rays of the rooms.
+        """
+        if (portals := Portals(zone)).portals:
+            self.portals.append(portals)
+
+        self.queue.extend(zone.building.find_all_matches('**/room?*_camera'))
+
+        if self.queue and not base.taskMgr.hasTaskNamed('cast_room_rays'):
+            base.taskMgr.add(self.cast_progressively, 'cast_room_rays')
+
+    def find_zone(self, node_path):
+        for zone in self.zones.zones:
+            if zone.building.is_ancestor_of(node_path):
+                return zone
+
+    def get_eyes(self, room_camera, room_zone):
+        """Return the positions of the room camera; a moving room camera is sampled along
+           its moving direction within the building.
+        """
+        pos = room_camera.get_pos(base.render)
+
+        if not (axis := room_camera.get_tag('moving_direction')):
+            return [pos]
+
+        end, tip = room_zone.bounds
+        idx = 'xyz'.index(axis)
+        eyes = []
+
+        for v in np.linspace(end[idx], tip[idx], self.samples + 2)[1:-1]:
+            eye = Point3(pos)
+            eye[idx] = v
+            eyes.append(eye)
+
+        return eyes
+
+    def is_blocked(self, eye, target, occluders):
+        hits = self.world.ray_test_all(eye, target, Mask.camera).get_hits()
+
+        # the invisible bodies and the bodies of the other buildings do not hide the target.
+        return any(hit.get_node() in occluders for hit in hits)
+
+    def find_escapes(self, eye, room_zone, occluders, escapes):
+        """Append the directions of the rays from the eye which leave the bounds of the building
+           of the room without being blocked to escapes, yielding after every pvs-chunk rays.
+        """
+        end, tip = (np.array(tuple(pt)) for pt in room_zone.bounds)
+        pos = np.array(tuple(eye))
+
+        # the distances along the rays to the faces of the bounds they go out of.
+        with np.errstate(divide='ignore', invalid='ignore'):
+            dists = np.where(self.directions > 0, (tip - pos) / self.directions, (end - pos) / self.directions)
+        dists = np.nan_to_num(dists, nan=np.inf, posinf=np.inf, neginf=np.inf)
+        lengths = np.maximum(dists.min(axis=1), 0) + 0.1
+        chunk = pvs_chunk.get_value()
+
+        for i in range(0, len(self.directions), chunk):
+            escapes.extend(direction for direction, length in zip(self.directions[i:i + chunk], lengths[i:i + chunk])
+                           if not self.is_blocked(eye, Point3(*(pos + direction * length)), occluders))
+            yield
+
+    def cast(self, room_camera, room_zone):
+        """Cast the rays of the room a chunk at a step, and keep the escaping directions from its eyes.
+        """
+        # the doors and the elevator do not occlude, because they move after the rays are cast.
+        occluders = {body.node() for body in room_zone.building.find_all_matches('**/+BulletRigidBodyNode')
+                     if body.node().is_static() and not body.is_hidden() and body != room_camera}
+        eyes = []
+
+        for eye in self.get_eyes(room_camera, room_zone):
+            escapes = []
+            yield from self.find_escapes(eye, room_zone, occluders, escapes)
+            eyes.append((eye, np.array(escapes).reshape(-1, 3)))
+
+        self.escapes[room_camera] = eyes
+
+        if room_camera == self.room_camera:
+            self.hide_zones(room_camera)
+
+    def cast_progressively(self, task):
+        """Take the steps of casting the rays of the rooms until the time budget of this frame runs out.
+           The rooms of the deactivated buildings, whose bodies are out of the world, wait until reactivated.
+        """
+        start = time.perf_counter()
+
+        while time.perf_counter() - start < pvs_frame_budget.get_value():
+            if self.casting is None:
+                if not (waiting := [nd for nd in self.queue if self.find_zone(nd).active]):
+                    break
+                self.queue.remove(room_camera := waiting[0])
+                room_zone = self.find_zone(room_camera)
+                self.casting = (room_camera, room_zone, self.cast(room_camera, room_zone))
+
+            room_camera, room_zone, steps = self.casting
+
+            if not room_zone.active:
+                self.queue.append(room_camera)
+                self.casting = None
+                continue
+
+            try:
+                next(steps)
+            except StopIteration:
+                self.casting = None
+
+        if self.queue or self.casting:
+            return task.cont
+
+        return task.done
+
+    def is_visible(self, eye, escapes, zone):
+        """Return True if any of the escaping rays points into the cone from the eye around
+           the bounding sphere of the zone, widened by the spacing of the rays.
+        """
+        end, tip = (np.array(tuple(pt)) for pt in zone.bounds)
+        center = (end + tip) / 2
+        radius = np.linalg.norm(tip - end) / 2
+        to_center = center - np.array(tuple(eye))
+
+        if (dist := np.linalg.norm(to_center)) <= radius:
+            return True
+
+        half_angle = math.asin(radius / dist) + self.spacing
+        return half_angle >= math.pi or bool(np.any(escapes @ (to_center / dist) >= math.cos(half_angle)))
+
+    def find_pvs(self, room_camera):
+        """Return the zones which can be seen from the room.
+        """
+        room_zone = self.find_zone(room_camera)
+        visible = {room_zone}
+
+        for eye, escapes in self.escapes[room_camera]:
+            visible.update(zone for zone in self.zones.zones if zone not in visible
+                           and self.is_visible(eye, escapes, zone))
+
+        return visible
+
+    def hide_zones(self, room_camera):
+        """Hide the buildings out of the potentially visible set of the room.
+        """
+        pvs = self.find_pvs(room_camera)
+
+        for zone in self.zones.zones:
+            if zone not in pvs:
+                zone.building.hide()
+                self.hidden.append(zone)
+
+    def enter(self, room_camera):
+        """Hide the buildings which cannot be seen from the room, as soon as its rays are cast.
+        """
+        self.leave()
+        self.room_camera = room_camera
+
+        if room_camera in self.escapes:
+            self.hide_zones(room_camera)
+        elif room_camera in self.queue:
+            self.queue.remove(room_camera)
+            self.queue.appendleft(room_camera)
+
+    def leave(self):
+        for zone in self.hidden:
+            zone.building.show()
+        self.hidden.clear()
+        self.room_camera = None
+
+    def cull_interiors(self, task):
+        """Hide the interiors of the rooms which cannot be seen from the cell of the camera.
+        """
+        cell = self.room_camera.get_name().removesuffix('_camera') if self.room_camera else None
+        lens_bounds = base.camLens.make_bounds()
+
+        for portals in self.portals:
+            if portals.zone.active:
+                portals.cull(cell, lens_bounds)
+
+        return task.cont
@@ -8,6 +8,7 @@ from panda3d.bullet import BulletRigidBodyNode
 from panda3d.core import PandaNode, NodePath, TransformState
 from panda3d.core import Vec3, Point3, LColor
 
+from assets import resolve
 from constants import Mask, MultiMask, Config
 from utils import create_line_node
 
@@ -71,6 +72,8 @@ class Walker(NodePath):
 
     RUN = 'run'
     WALK = 'walk'
+    MODEL = 'models/ralph/ralph.egg'
+    ANIMS = {RUN: 'models/ralph/ralph-run.egg', WALK: 'models/ralph/ralph-walk.egg'}
 
     def __init__(self, world):
         super().__init__(BulletRigidBodyNode(Config.character))
@@ -94,14 +97,8 @@ class Walker(NodePath):
         self.direction_nd.set_h(180)
         self.direction_nd.reparent_to(self)
 
-        self.actor = Actor(
-            'models/ralph/ralph.egg',
-            {self.RUN: 'models/ralph/ralph-run.egg',
-             self.WALK: 'models/ralph/ralph-walk.egg'}
-        )
-        self.actor.set_transform(TransformState.make_pos(Vec3(0, 0, -2.5)))
-        self.actor.set_name('ralph')
-        self.actor.reparent_to(self.direction_nd)
+        # Ralph is loaded by load_actor after the models are preloaded.
+        self.actor = None
         self.actor_h = 1.4
 
         self.front = NodePath('front')
@@ -117,6 +114,12 @@ class Walker(NodePath):
         self.draw_debug_lines()
         self.test_shape = BulletBoxShape(Vec3(0.3, 0.3, 1.2))
 
+    def load_actor(self):
+        self.actor = Actor(resolve(self.MODEL), {k: resolve(v) for k, v in self.ANIMS.items()})
+        self.actor.set_transform(TransformState.make_pos(Vec3(0, 0, -2.5)))
+        self.actor.set_name('ralph')
+        self.actor.reparent_to(self.direction_nd)
+
     def draw_debug_lines(self):
         """Draw ray cast lines for dubug.
         """
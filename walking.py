@@ -1,4 +1,6 @@
+import argparse
 import sys
+import time
 
 from direct.interval.LerpInterval import LerpFunc
 from direct.interval.IntervalGlobal import Sequence, Func
@@ -11,9 +13,15 @@ from panda3d.bullet import BulletDebugNode
 from panda3d.core import NodePath, PandaNode, TextNode
 from panda3d.core import Vec3, Point3, Quat
 
+from assets import AssetPreloader, AssetRegistry, AssetKinds
+from buildings import TextureImages
 from constants import Mask, MultiMask, Config
+from create_softbody import SoftBodyScheduler
+from governor import QualityGovernor
 from lights import BasicAmbientLight, BasicDayLight
-from scene import Scene, Skies
+from materials import BUILDING_SHADER
+from profiler import StartupProfiler
+from scene import Scene, Sky, Skies
 from walker import Walker, Motions
 
 
@@ -70,23 +78,61 @@ class Sound(Sequence):
 
 class Walking(ShowBase):
 
+    FIREWORKS_SOUND = 'sounds/fireworks.mp3'
+
     def __init__(self):
         super().__init__()
         self.disable_mouse()
         self.world = BulletWorld()
         self.world.set_gravity(Vec3(0, 0, Config.gravity))
-
-        self.debug_np = self.render.attach_new_node(BulletDebugNode('debug'))
-        self.world.set_debug_node(self.debug_np.node())
-
-        self.walker = Walker(self.world)
-        self.floater = NodePath('floater')
-        self.floater.set_z(2.0)
-        self.floater.reparent_to(self.walker)
+        self.profiler = StartupProfiler()
+        self.profiler.start(self.world)
+
+        with self.profiler.phase('physics'):
+            self.debug_np = self.render.attach_new_node(BulletDebugNode('debug'))
+            self.world.set_debug_node(self.debug_np.node())
+            self.softbody_scheduler = SoftBodyScheduler(self.world)
+            # the bodies of the walker, the terrain and the buildings need no assets.
+            self.walker = Walker(self.world)
+            self.scene = Scene(self.world, self.walker)
+
+        # the rest of the scene is made after the assets are loaded in the background.
+        self.progress_text = OnscreenText(text='Loading...', fg=(1, 1, 1, 1), scale=0.07)
+        self.accept('asset_progress', self.show_progress)
+        self.accept_once('assets_loaded', self.setup)
+        self.profiler.begin('preload')
+        self.preload_assets()
+
+    def preload_assets(self):
+        self.preloader = AssetPreloader()
+        # the night sky and the fireworks sound are loaded when the night comes.
+        self.preloader.add_models(Sky.DAY_MODEL, Walker.MODEL, *Walker.ANIMS.values())
+        self.preloader.add_textures(*[image.path for image in TextureImages])
+        self.preloader.add_shaders(Scene.TERRAIN_SHADER, Scene.TERRAIN_TILE_SHADER, Scene.FIREWORKS_SHADER,
+                                   Scene.NIGHT_SKY_SHADER, BUILDING_SHADER)
+        self.preloader.start()
+
+    def show_progress(self, loaded, total):
+        self.progress_text.text = f'Loading... {loaded}/{total}'
+
+    def setup(self):
+        self.profiler.end()
+        self.ignore('asset_progress')
+        self.progress_text.destroy()
+
+        with self.profiler.phase('walker'):
+            self.walker.load_actor()
+            self.floater = NodePath('floater')
+            self.floater.set_z(2.0)
+            self.floater.reparent_to(self.walker)
 
         ambient_light = BasicAmbientLight()
         directional_light = BasicDayLight(self.walker)
-        self.scene = Scene(self.world, ambient_light, directional_light)
+
+        with self.profiler.phase('scene'):
+            self.scene.setup(ambient_light, directional_light)
+
+        self.governor = QualityGovernor(self.scene, directional_light)
 
         self.camera.reparent_to(self.walker)
         self.camera.set_pos(self.walker.navigate())
@@ -96,7 +142,7 @@ class Walking(ShowBase):
         self.instructions = Instructions()
         self.instructions.hide()
 
-        self.firework_sfx = base.loader.load_sfx('sounds/fireworks.mp3')
+        self.firework_sfx = None
         self.movable_room_camera = None
 
         inputState.watch_with_modifiers('forward', 'arrow_up')
@@ -113,6 +159,12 @@ class Walking(ShowBase):
 
         self.taskMgr.add(self.update, 'update')
 
+        # the buildings far from the walker may be still being built.
+        if self.scene.pending_buildings:
+            self.accept_once('buildings_built', self.profiler.finish)
+        else:
+            self.profiler.finish()
+
     def toggle_debug(self):
         if self.debug_np.is_hidden():
             self.debug_np.show()
@@ -129,11 +181,18 @@ class Walking(ShowBase):
         match floor:
             case 1:
                 self.scene.change_sky(Skies.DAY)
-                Sound(self.firework_sfx).fade_out()
+
+                if self.firework_sfx:
+                    Sound(self.firework_sfx).fade_out()
+                    AssetRegistry().release(AssetKinds.SOUND, self.FIREWORKS_SOUND)
+                    self.firework_sfx = None
 
             case 2:
                 self.scene.change_sky(Skies.NIGHT)
-                Sound(self.firework_sfx).fade_in()
+
+                if not self.firework_sfx:
+                    self.firework_sfx = AssetRegistry().acquire(AssetKinds.SOUND, self.FIREWORKS_SOUND)
+                    Sound(self.firework_sfx).fade_in()
 
     def control_walker(self, dt):
         inputs = []
@@ -151,6 +210,9 @@ class Walking(ShowBase):
 
     def print_info(self):
         print('walker', self.walker.get_pos())
+        print('assets', {kind.name: size for kind, size in AssetRegistry().get_memory_usage().items()})
+        print('quality', self.governor.tier.name if self.governor.tier else 'governor off')
+        print('active zones', f'{self.scene.zones.get_active_count()}/{len(self.scene.zones.zones)}')
 
     def ray_cast(self, from_pos, to_pos):
         if (result := self.world.ray_test_closest(
@@ -200,6 +262,7 @@ class Walking(ShowBase):
                 self.camera.reparent_to(room_camera)
                 self.camera.set_pos(0, 0, 0)
                 self.camera.look_at(self.floater)
+                self.scene.visibility.enter(room_camera)
 
     def control_camera_indoors(self):
         if self.movable_room_camera:
@@ -220,6 +283,7 @@ class Walking(ShowBase):
                 self.camera.reparent_to(self.walker)
                 self.camera.set_pos(0, -10, 2)
                 self.camera.look_at(self.floater)
+                self.scene.visibility.leave()
 
     def update(self, task):
         dt = globalClock.get_dt()
@@ -230,10 +294,17 @@ class Walking(ShowBase):
         else:
             self.control_camera_indoors()
 
+        start = time.perf_counter()
         self.world.do_physics(dt)
+        self.softbody_scheduler.report(time.perf_counter() - start)
         return task.cont
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Walking in BulletWorld.')
+    parser.add_argument('--profile-startup', metavar='PATH', help='write the startup profile into a json file')
+    args = parser.parse_args()
+
+    StartupProfiler(args.profile_startup)
     app = Walking()
     app.run()
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""Activate the buildings near the focus and deactivate the others.
+
+A deactivated building is stashed except for its impostor, its rigid bodies, ghosts and constraints are removed from
+the BulletWorld, and its tasks are removed from the task manager. Its ropes and cloths are hidden and removed
+from the BulletWorld by their makers, keeping their anchors. Its textures are released
+from AssetRegistry and the GPU. The constraints, sensors and elevators keep their states in
+the python objects, so the doors and the elevator go on from where they were when reactivated.
+"""
+from panda3d.core import ConfigVariableDouble
+
+from utils import singleton
+
+
+# the buildings farther than zone-radius from the focus are deactivated.
+zone_radius = ConfigVariableDouble('zone-radius', 100)
+zone_margin = ConfigVariableDouble('zone-margin', 10)
+
+
+class Zone:
+    """Args:
+            world (BulletWorld): bullet world
+            building (Buildings): the building activated and deactivated together;
+    """
+
+    def __init__(self, world, building):
+        self.world = world
+        self.building = building
+        self.active = True
+        self.textures = dict()
+
+        # the impostor of the building is left to be drawn beyond the zone radius.
+        if (detail := building.find('*/impostor_detail')).is_empty():
+            detail = building
+        self.detail = detail
+
+        # the knobs move with the doors and are not attached to the world.
+        knobs = [link['obj'] for link in building.links if link['type'] == 'knob']
+        self.bodies = [nd.node() for nd in building.find_all_matches('**/+BulletBodyNode') if nd not in knobs]
+        self.constraints = [link['obj'] for link in building.links if link['type'] in ('twist', 'slider')]
+        self.tasks = [link for link in building.links if link['type'] == 'task']
+        # the makers of the soft bodies, which are not under the building.
+        self.softbody_makers = list(dict.fromkeys(
+            link['obj'] for link in building.links if link['type'] in ('rope', 'cloth')))
+
+        self.bounds = end, tip = building.get_tight_bounds(base.render)
+        self.center = (end + tip) / 2
+        self.radius = (tip - end).length() / 2
+
+    def get_distance(self, pos):
+        return max((pos - self.center).length() - self.radius, 0)
+
+    def deactivate(self):
+        for link in self.tasks:
+            base.taskMgr.remove(link['name'])
+
+        # the soft bodies are removed before the bodies they are anchored to.
+        for maker in self.softbody_makers:
+            maker.suspend()
+
+        for constraint in self.constraints:
+            self.world.remove(constraint)
+
+        for body in self.bodies:
+            self.world.remove(body)
+
+        self.detail.stash()
+
+        # the textures are reloaded through AssetRegistry if they are unloaded before reactivated.
+        # the registry frees their GPU memory if no other building uses them.
+        self.textures = dict(self.building.textures)
+        self.building.release_textures()
+        self.active = False
+
+    def activate(self):
+        for image, tex in self.textures.items():
+            if (new_tex := self.building.texture(image)) is not tex:
+                self.building.replace_texture(tex, new_tex)
+        self.textures.clear()
+
+        self.detail.unstash()
+
+        for body in self.bodies:
+            self.world.attach(body)
+
+        for constraint in self.constraints:
+            self.world.attach_constraint(constraint, True)
+
+        for maker in self.softbody_makers:
+            maker.resume()
+
+        for link in self.tasks:
+            base.taskMgr.add(getattr(link['target'], link['method']), link['name'])
+
+        self.active = True
+
+
+@singleton
+class ZoneManager:
+    """Activate and deactivate the zones of the buildings by the distance from the focus.
+       Args:
+            world (BulletWorld): bullet world
+            focus (NodePath): the zones near this are active;
+            interval (float): the seconds between updates;
+    """
+
+    def __init__(self, world, focus, interval=0.5):
+        self.world = world
+        self.focus = focus
+        self.zones = []
+        base.taskMgr.do_method_later(interval, self.update, 'zone_manager')
+
+    def register(self, building):
+        zone = Zone(self.world, building)
+        self.zones.append(zone)
+        return zone
+
+    def update(self, task):
+        pos = self.focus.get_pos(base.render)
+        radius = zone_radius.get_value()
+
+        for zone in self.zones:
+            distance = zone.get_distance(pos)
+
+            if zone.active and distance > radius + zone_margin.get_value():
+                zone.deactivate()
+            elif not zone.active and distance < radius:
+                zone.activate()
+
+        return task.again
+
+    def get_active_count(self):
+        return sum(zone.active for zone in self.zones)